@@ -49,4 +49,12 @@ if OPENCV_FOUND and OPENCV_VERSION_COMPATIBLE:
                 OPENCV_CASCADE_PATH = path
 
     from .cvloop import cvloop  # noqa: W0611
+    from .annotations import Annotations  # noqa: W0611
+    from .buffers import FramePool  # noqa: W0611
+    from .cache import CachedFunction, ResultCache  # noqa: W0611
+    from .metrics import JSONLinesExporter, PrometheusExporter  # noqa: W0611
+    from .offline import aiterate_frames, iterate_frames, is_batched  # noqa: E501 W0611
+    from .parallel import ProcessPool  # noqa: W0611
+    from .regions import RegionOfInterest  # noqa: W0611
+    from .sources import ReplaySource, SyntheticSource  # noqa: W0611
     from .functions import *  # noqa: W0401, W0611 pylint: disable=wildcard-import
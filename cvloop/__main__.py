@@ -0,0 +1,5 @@
+"""Runs the cvloop command line interface, see cvloop.batch."""
+
+from .batch import main
+
+main()
@@ -0,0 +1,173 @@
+"""Provides a compact, columnar storage for large sets of annotations."""
+
+import numpy as np
+
+
+SHAPES = ('RECT', 'CIRC')
+
+
+class Annotations:
+    """Stores annotations column-wise in numpy arrays.
+
+    Instead of a list of lists with one options dictionary per annotation,
+    all values are kept in one array per column, sorted by frame. This keeps
+    large ground truth files compact and allows to look up the annotations of
+    a frame with a binary search.
+
+    An instance can be passed as `annotations` to cvloop.
+    """
+
+    def __init__(self, x, y, frame, shape=None, size=None, color=None,
+                 palette=None):
+        """Initializes the `Annotations`.
+
+        All columns must have the same length. The optional columns use -1 (or
+        a non-positive size) to mark values which should fall back to the
+        annotations_default of the cvloop.
+
+        Args:
+            x: The x coordinates of the centers.
+            y: The y coordinates of the centers.
+            frame: The frame numbers.
+            shape: Shape codes, indices into `SHAPES` (0: 'RECT', 1: 'CIRC').
+            size: Sizes, either one value per annotation (radius for CIRC,
+                  width and height for RECT) or two values (width, height).
+            color: Color indices into the palette.
+            palette: A sequence of colors which can be understood by
+                     matplotlib, indexed by the color column.
+        """
+        frame = np.asarray(frame)
+        order = np.argsort(frame, kind='stable')
+
+        self.frame = frame[order].astype(np.int64)
+        self.x = np.asarray(x)[order].astype(np.int32)
+        self.y = np.asarray(y)[order].astype(np.int32)
+        self.shape = (None if shape is None else
+                      np.asarray(shape)[order].astype(np.int8))
+        self.size = None
+        if size is not None:
+            size = np.asarray(size, dtype=np.float32)[order]
+            self.size = size if size.ndim == 2 else np.stack((size, size), 1)
+        self.color = (None if color is None else
+                      np.asarray(color)[order].astype(np.int32))
+        self.palette = list(palette) if palette is not None else []
+
+        for column in (self.x, self.y, self.shape, self.size, self.color):
+            if column is not None and len(column) != len(self.frame):
+                raise ValueError('All annotation columns must have the same '
+                                 'length.')
+
+    @classmethod
+    def from_records(cls, records, palette=None):
+        """Creates `Annotations` from a structured numpy array.
+
+        The array needs the fields `x`, `y` and `frame`, and may have the
+        fields `shape`, `size` and `color`.
+
+        Args:
+            records: The structured array.
+            palette: A sequence of colors for the color indices.
+
+        Returns:
+            The annotations.
+        """
+        fields = records.dtype.names or ()
+        return cls(records['x'], records['y'], records['frame'],
+                   **{name: records[name]
+                      for name in ('shape', 'size', 'color')
+                      if name in fields},
+                   palette=palette)
+
+    @classmethod
+    def from_csv(cls, path, palette=None, delimiter=',', skiprows=1):
+        """Loads `Annotations` from a CSV file.
+
+        The columns are expected in the order x, y, frame, shape, size, color.
+        The last three columns are optional.
+
+        Args:
+            path: The path to the CSV file.
+            palette: A sequence of colors for the color indices.
+            delimiter: The column delimiter. (Default: ',')
+            skiprows: Number of header rows to skip. (Default: 1)
+
+        Returns:
+            The annotations.
+        """
+        data = np.loadtxt(path, delimiter=delimiter, skiprows=skiprows,
+                          ndmin=2, dtype=np.float64)
+        columns = [data[:, i] for i in range(min(data.shape[1], 6))]
+        return cls(*columns, palette=palette)
+
+    @classmethod
+    def from_npz(cls, path, palette=None):
+        """Loads `Annotations` from a NPZ file.
+
+        The file needs the arrays `x`, `y` and `frame`, and may contain the
+        arrays `shape`, `size`, `color`, and `palette`. An explicitly passed
+        palette takes precedence over the stored one.
+
+        Args:
+            path: The path to the NPZ file.
+            palette: A sequence of colors for the color indices.
+
+        Returns:
+            The annotations.
+        """
+        with np.load(path) as data:
+            if palette is None and 'palette' in data:
+                palette = [tuple(color) if isinstance(color, list) else color
+                           for color in data['palette'].tolist()]
+            return cls(data['x'], data['y'], data['frame'],
+                       **{name: data[name]
+                          for name in ('shape', 'size', 'color')
+                          if name in data},
+                       palette=palette)
+
+    def __len__(self):
+        """Returns the number of annotations."""
+        return len(self.frame)
+
+    def window(self, start, stop):
+        """Returns the index range of annotations with start <= frame < stop.
+
+        Args:
+            start: The first frame.
+            stop: The frame after the last frame.
+
+        Returns:
+            A slice into the columns.
+        """
+        return slice(*np.searchsorted(self.frame, (start, stop)))
+
+    def for_frame(self, frame, default_shape='RECT'):
+        """Returns the annotations of a frame in the list format.
+
+        Only options which are set in the columns are added to the options
+        dictionaries, all others are left to the annotations_default.
+
+        Args:
+            frame: The frame number.
+            default_shape: The shape used for annotations without a shape
+                           code, needed to decide whether sizes are radii.
+                           (Default: 'RECT')
+
+        Returns:
+            A list of annotations [x, y, frame, options].
+        """
+        window = self.window(frame, frame + 1)
+        annotations = []
+        for i in range(window.start, window.stop):
+            options = {}
+            shape = default_shape
+            if self.shape is not None and self.shape[i] >= 0:
+                shape = options['shape'] = SHAPES[self.shape[i]]
+            if self.size is not None and self.size[i, 0] > 0:
+                width, height = (int(v) for v in self.size[i])
+                options['size'] = width if shape == 'CIRC' else (width,
+                                                                 height)
+            if self.color is not None and self.color[i] >= 0:
+                options['color'] = self.palette[self.color[i]]
+            annotations.append([int(self.x[i]), int(self.y[i]), frame,
+                                options])
+        return annotations
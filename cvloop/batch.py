@@ -0,0 +1,315 @@
+"""Applies cvloop functions to directories of videos in parallel.
+
+Usage:
+    python -m cvloop process --function Inverter --jobs 8 in/ out/
+
+Each file is processed by its own worker process with its own capture,
+writer and a freshly constructed function. With --segment-frames, outputs
+are written in segments, so interrupted jobs resume after the last complete
+segment.
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from .factories import create_function
+from .offline import iterate_frames
+
+
+VIDEO_EXTENSIONS = ('.avi', '.mkv', '.mov', '.mp4', '.mpg', '.mpeg', '.webm')
+
+# Codecs for containers which can not hold the default mp4v.
+FOURCCS = {'.webm': 'VP80'}
+
+
+def part_path(output, index, temporary=False):
+    """Returns the path of an output segment.
+
+    Args:
+        output: The final output path.
+        index: The segment index.
+        temporary: If True, returns the path to write the segment to before
+                   it is complete.
+
+    Returns:
+        The segment path.
+    """
+    stem, ext = os.path.splitext(output)
+    return '{}.part{:05d}{}{}'.format(stem, index,
+                                      '.tmp' if temporary else '', ext)
+
+
+def default_fourcc(output):
+    """Returns the four character code of a codec the output's container
+    supports."""
+    return FOURCCS.get(os.path.splitext(output)[1].lower(), 'mp4v')
+
+
+def open_writer(path, fourcc, fps, size, color=True):
+    """Opens a `cv2.VideoWriter`.
+
+    Args:
+        path: The file to write.
+        fourcc: The four character code of the codec.
+        fps: The frame rate.
+        size: The frame size (width, height).
+        color: If False, writes gray scale frames. (Default: True)
+
+    Returns:
+        The writer.
+
+    Raises:
+        RuntimeError: If the file can not be written with the codec.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size,
+                             color)
+    if not writer.isOpened():
+        raise RuntimeError('Can not write {} with the codec {}, choose '
+                           'another one with --fourcc.'.format(path, fourcc))
+    return writer
+
+
+def to_bgr(frame):
+    """Converts a processed RGB or gray frame to uint8 for writing."""
+    if frame.dtype != np.uint8:
+        if np.issubdtype(frame.dtype, np.floating):
+            frame = frame * 255
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+    if frame.ndim == 3 and frame.shape[2] >= 3:
+        return cv2.cvtColor(np.ascontiguousarray(frame[..., :3]),
+                            cv2.COLOR_RGB2BGR)
+    return frame
+
+
+class SegmentWriter:
+    """Writes frames into numbered segments of a fixed number of frames."""
+
+    def __init__(self, output, fps, fourcc, segment_frames, first_segment):
+        """Initializes the `SegmentWriter`.
+
+        Args:
+            output: The final output path.
+            fps: The frame rate.
+            fourcc: The four character code of the codec.
+            segment_frames: The number of frames per segment, None for a
+                            single segment.
+            first_segment: The index of the first segment to write.
+        """
+        self.output = output
+        self.fps = fps
+        self.fourcc = fourcc
+        self.segment_frames = segment_frames
+        self.index = first_segment
+        self.writer = None
+        self.count = 0
+
+    def write(self, frame):
+        """Writes a frame, starting a new segment if needed."""
+        if self.writer is None:
+            self.writer = open_writer(
+                part_path(self.output, self.index, temporary=True),
+                self.fourcc, self.fps, (frame.shape[1], frame.shape[0]),
+                frame.ndim == 3)
+        self.writer.write(frame)
+        self.count += 1
+        if self.count == self.segment_frames:
+            self.finish()
+
+    def finish(self):
+        """Completes the current segment."""
+        if self.writer is None:
+            return
+        self.writer.release()
+        self.writer = None
+        os.replace(part_path(self.output, self.index, temporary=True),
+                   part_path(self.output, self.index))
+        self.index += 1
+        self.count = 0
+
+
+def join_segments(output, fps, fourcc):
+    """Joins the complete segments of an output and removes them.
+
+    A single segment is renamed. Multiple segments are decoded and encoded
+    again, which costs a second lossy encoding.
+
+    Args:
+        output: The final output path.
+        fps: The frame rate.
+        fourcc: The four character code of the codec.
+    """
+    stem, ext = os.path.splitext(output)
+    parts = sorted(glob.glob('{}.part{}{}'.format(
+        glob.escape(stem), '[0-9]' * 5, glob.escape(ext))))
+    if len(parts) == 1:
+        os.replace(parts[0], output)
+        return
+    temporary = part_path(output, len(parts), temporary=True)
+    writer = None
+    for part in parts:
+        capture = cv2.VideoCapture(part)
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            if writer is None:
+                writer = open_writer(temporary, fourcc, fps,
+                                     (frame.shape[1], frame.shape[0]))
+            writer.write(frame)
+        capture.release()
+    if writer is not None:
+        writer.release()
+        os.replace(temporary, output)
+    for part in parts:
+        os.remove(part)
+
+
+def process_file(source, output, function, kwargs=None, *, fourcc=None,
+                 segment_frames=None, batch_size=16):
+    """Applies a function to all frames of a video and writes the result.
+
+    By default, the output is written in one go, and interrupted runs start
+    over. If segment_frames is set, the output is written in segments of
+    segment_frames frames, which are joined at the end. If segments of a
+    previous run exist, processing resumes after the last complete one;
+    stateful functions then start fresh at that frame. Joining more than one
+    segment encodes the frames a second time, which costs quality and time.
+
+    Args:
+        source: The input video path.
+        output: The output video path.
+        function: The function name, see create_function.
+        kwargs: The keyword arguments for the function.
+        fourcc: The four character code of the output codec.
+                (Default: 'VP80' for WebM, 'mp4v' otherwise)
+        segment_frames: The number of frames per segment, None to write the
+                        output without segments. (Default: None)
+        batch_size: The batch size for batched functions. (Default: 16)
+
+    Returns:
+        A tuple of the source path, the number of processed frames (None if
+        the output exists already) and the processing time in seconds.
+    """
+    start = time.perf_counter()
+    if os.path.exists(output):
+        return source, None, 0
+    fourcc = fourcc or default_fourcc(output)
+
+    first_segment = 0
+    while segment_frames and os.path.exists(part_path(output,
+                                                      first_segment)):
+        first_segment += 1
+
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    first_frame = first_segment * (segment_frames or 0)
+    if first_frame:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+        while capture.get(cv2.CAP_PROP_POS_FRAMES) < first_frame:
+            if not capture.grab():
+                break
+
+    writer = SegmentWriter(output, fps, fourcc, segment_frames,
+                           first_segment)
+    frames = 0
+    try:
+        for _, _, processed in iterate_frames(
+                capture, create_function(function, kwargs),
+                batch_size=batch_size):
+            writer.write(to_bgr(processed))
+            frames += 1
+        writer.finish()
+    finally:
+        capture.release()
+    join_segments(output, fps, fourcc)
+    return source, frames, time.perf_counter() - start
+
+
+def process_directory(input_dir, output_dir, function, kwargs=None, *,
+                      jobs=None, **options):
+    """Processes all videos of a directory with a pool of worker processes.
+
+    Files which fail are reported and skipped, the other files are still
+    processed.
+
+    Args:
+        input_dir: The directory containing the videos.
+        output_dir: The directory to write the results to, using the same
+                    file names.
+        function: The function name, see create_function.
+        kwargs: The keyword arguments for the function.
+        jobs: The number of worker processes. (Default: number of CPUs)
+        options: Passed on to process_file.
+
+    Returns:
+        A tuple of the total number of frames and the aggregate frames per
+        second.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sources = sorted(name for name in os.listdir(input_dir)
+                     if name.lower().endswith(VIDEO_EXTENSIONS))
+    start = time.perf_counter()
+    total = 0
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(process_file, os.path.join(input_dir, name),
+                               os.path.join(output_dir, name), function,
+                               kwargs, **options): name
+                   for name in sources}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                source, frames, seconds = future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                failed += 1
+                print('{}: failed: {}'.format(
+                    os.path.join(input_dir, futures[future]), error))
+                continue
+            if frames is None:
+                print('{}: done already'.format(source))
+            elif frames:
+                total += frames
+                print('{}: {} frames, {:.1f} fps'.format(
+                    source, frames, frames / seconds))
+            else:
+                print('{}: no frames read'.format(source))
+    fps = total / (time.perf_counter() - start)
+    print('{} files, {} failed, {} frames, {:.1f} fps'.format(
+        len(sources), failed, total, fps))
+    return total, fps
+
+
+def main(argv=None):
+    """Parses the command line arguments and runs the command."""
+    parser = argparse.ArgumentParser(prog='python -m cvloop',
+                                     description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    process = commands.add_parser(
+        'process', help='apply a function to a directory of videos')
+    process.add_argument('input_dir')
+    process.add_argument('output_dir')
+    process.add_argument('--function', required=True,
+                         help='a class in cvloop.functions or module:name')
+    process.add_argument('--args', default='{}', type=json.loads,
+                         help='constructor keyword arguments as JSON')
+    process.add_argument('--jobs', type=int, default=None)
+    process.add_argument('--fourcc', default=None,
+                         help='the output codec (default: VP80 for .webm, '
+                              'mp4v otherwise)')
+    process.add_argument('--segment-frames', type=int, default=None,
+                         help='write resumable segments of this many frames '
+                              '(joining them encodes the frames again)')
+    process.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    process_directory(args.input_dir, args.output_dir, args.function,
+                      args.args, jobs=args.jobs, fourcc=args.fourcc,
+                      segment_frames=args.segment_frames,
+                      batch_size=args.batch_size)
@@ -0,0 +1,85 @@
+"""Provides a pool of preallocated frame buffers.
+
+Reading and color converting a frame allocates two full-size images per
+frame, which at 4K means hundreds of megabytes per second of short-lived
+allocations and the page faults that come with them. Captures and
+`cv2.cvtColor` can write into existing arrays instead, so cvloop recycles a
+few buffers once nothing but the pool references them anymore.
+"""
+
+import sys
+
+import numpy as np
+
+
+class FramePool:
+    """Recycles numpy arrays of the shape and dtype of the last frame.
+
+    A buffer is only handed out again once no one but the pool references it,
+    i.e. neither the function nor the display (nor views of it) hold on to
+    it, so reusing buffers never changes frames which are still in use.
+    """
+
+    def __init__(self, size=4):
+        """Initializes the `FramePool`.
+
+        Args:
+            size: The maximum number of buffers. (Default: 4)
+        """
+        self.size = size
+        self.buffers = []
+        self.template = None
+        self.allocations = 0
+
+        # The reference count of a buffer referenced by nothing but the pool,
+        # measured the same way get checks buffers, as the references held
+        # by the list, the loop variable and the call depend on the
+        # interpreter.
+        probe = [np.empty(0)]
+        for buffer in probe:
+            self.unreferenced = sys.getrefcount(buffer)
+
+    @property
+    def nbytes(self):
+        """The total size of the buffers."""
+        return sum(buffer.nbytes for buffer in self.buffers)
+
+    def get(self):
+        """Returns an unused buffer like the last frame.
+
+        Returns:
+            A buffer or None if the shape of the frames is not known yet or
+            all buffers are in use.
+        """
+        if self.template is None:
+            return None
+        shape, dtype = self.template
+        for buffer in self.buffers:
+            if buffer.shape == shape and buffer.dtype == dtype and \
+                    sys.getrefcount(buffer) <= self.unreferenced:
+                return buffer
+        if len(self.buffers) >= self.size:
+            self.buffers = [buffer for buffer in self.buffers
+                            if buffer.shape == shape and
+                            buffer.dtype == dtype]
+            if len(self.buffers) >= self.size:
+                return None
+        self.allocations += 1
+        self.buffers.append(np.empty(shape, dtype))
+        return self.buffers[-1]
+
+    def put(self, frame):
+        """Registers a frame, which determines the shape of the next buffers.
+
+        Frames which were not handed out by the pool (e.g. allocated by
+        OpenCV because no buffer fit) are adopted if there is room.
+
+        Args:
+            frame: The frame.
+        """
+        if not isinstance(frame, np.ndarray):
+            return
+        self.template = (frame.shape, frame.dtype)
+        if frame.base is None and len(self.buffers) < self.size and \
+                not any(buffer is frame for buffer in self.buffers):
+            self.buffers.append(frame)
@@ -0,0 +1,325 @@
+"""Provides a persistent cache for the results of deterministic functions."""
+
+import functools
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+import types
+
+import numpy as np
+
+
+def source_key(source):
+    """Returns a string identifying a video source, if possible.
+
+    Files are identified by their absolute path, size, and modification
+    time. Other sources can provide a `cache_key` attribute.
+
+    Args:
+        source: The video source.
+
+    Returns:
+        The key or None if the source can not be identified.
+    """
+    if isinstance(source, str) and os.path.isfile(source):
+        stat = os.stat(source)
+        return 'file:{}:{}:{}'.format(os.path.abspath(source), stat.st_size,
+                                      stat.st_mtime_ns)
+    return getattr(source, 'cache_key', None)
+
+
+def function_key(function):
+    """Returns a string identifying a function and its parameters.
+
+    Functions can provide a `cache_key` attribute. Plain Python functions are
+    identified by their qualified name, their byte code, their defaults, the
+    contents of their closure, and the globals they reference. Other objects
+    are identified by their class and all their attributes, recursively
+    (e.g. the function of a `RegionOfInterest`). Attributes which hold runtime
+    state rather than parameters, like OpenCV models, locks, or frame
+    counters, are listed by the class in a `cache_ignore` attribute.
+
+    Args:
+        function: The function.
+
+    Returns:
+        The key.
+
+    Raises:
+        ValueError: If a part of the function can not be identified.
+    """
+    return _key(function, ())
+
+
+def _code_key(code):
+    """Hashes byte code, names and constants, including nested code."""
+    digest = hashlib.sha1(code.co_code)
+    digest.update(repr((code.co_names, code.co_freevars)).encode('utf-8'))
+    for constant in code.co_consts:
+        digest.update(_constant_key(constant).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _constant_key(constant):
+    """Returns a canonical string for a code constant.
+
+    The order of frozensets depends on the hash seed, so their members are
+    sorted.
+    """
+    if isinstance(constant, types.CodeType):
+        return _code_key(constant)
+    if isinstance(constant, tuple):
+        return '({})'.format(', '.join(_constant_key(item)
+                                       for item in constant))
+    if isinstance(constant, frozenset):
+        return 'frozenset({{{}}})'.format(', '.join(sorted(
+            _constant_key(item) for item in constant)))
+    return repr(constant)
+
+
+def _key(value, parents):  # pylint: disable=too-many-return-statements
+    """Returns the key of a value, see function_key.
+
+    Args:
+        value: The value.
+        parents: The ids of the objects containing value, to stop at cycles.
+    """
+    if isinstance(value, (bool, int, float, complex, str, bytes, type(None),
+                          np.generic)):
+        return repr(value)
+    if isinstance(value, np.ndarray):
+        return 'array{}{}:{}'.format(value.shape, value.dtype, hashlib.sha1(
+            np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value, types.ModuleType):
+        return 'module:' + value.__name__
+    if isinstance(value, type):
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    if id(value) in parents:
+        return '<cycle>'
+    parents += (id(value),)
+
+    if not isinstance(value, (list, tuple, dict, set, frozenset)):
+        key = getattr(value, 'cache_key', None)
+        if key is not None:
+            return key
+    if isinstance(value, (list, tuple)):
+        return '{}[{}]'.format(type(value).__name__, ', '.join(
+            _key(item, parents) for item in value))
+    if isinstance(value, (set, frozenset)):
+        # Sorted, as the iteration order depends on the hash seed.
+        return '{}{{{}}}'.format(type(value).__name__, ', '.join(sorted(
+            _key(item, parents) for item in value)))
+    if isinstance(value, dict):
+        return '{{{}}}'.format(', '.join(sorted(
+            '{}: {}'.format(_key(name, parents), _key(item, parents))
+            for name, item in value.items())))
+    if isinstance(value, types.MethodType):
+        return 'method:{}.{}'.format(_key(value.__self__, parents),
+                                     _key(value.__func__, parents))
+    if isinstance(value, functools.partial):
+        return 'partial:{}'.format(_key((value.func, value.args,
+                                         value.keywords), parents))
+    if isinstance(value, types.FunctionType):
+        code = value.__code__
+        cells = []
+        for cell in value.__closure__ or ():
+            try:
+                cells.append(cell.cell_contents)
+            except ValueError:  # Empty cell.
+                cells.append(None)
+        referenced = {name: value.__globals__[name] for name in code.co_names
+                      if name in value.__globals__}
+        return '{}.{}:{}{}'.format(
+            value.__module__, value.__qualname__, _code_key(code),
+            _key((value.__defaults__, value.__kwdefaults__, cells,
+                  referenced), parents))
+    if isinstance(value, (types.BuiltinFunctionType, np.ufunc)):
+        return 'builtin:{}.{}'.format(getattr(value, '__module__', None) or
+                                      type(value).__module__, value.__name__)
+    if hasattr(value, '__dict__'):
+        ignored = getattr(type(value), 'cache_ignore', ())
+        return '{}{}'.format(_key(type(value), parents), _key(
+            {name: item for name, item in vars(value).items()
+             if name not in ignored}, parents))
+    raise ValueError('{!r} can not be identified for caching. Provide a '
+                     '`cache_key` or list the attribute holding it in '
+                     '`cache_ignore`.'.format(value))
+
+
+class ResultCache:
+    """Stores arrays in an SQLite file, evicting the least recently used
+    entries when the size limit is exceeded."""
+
+    def __init__(self, path, max_bytes=2 ** 30):
+        """Initializes the `ResultCache`.
+
+        Args:
+            path: The cache file. It is created if it does not exist.
+            max_bytes: The maximum total size of the stored arrays.
+                       (Default: 1 GiB)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # Write-ahead logging lets other processes read while one writes and
+        # makes the commit of every access cheap.
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS results ('
+                        'key TEXT PRIMARY KEY, value BLOB, '
+                        'size INTEGER, used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_used '
+                        'ON results (used)')
+        self.db.commit()
+        self.total = self.size()
+
+    def size(self):
+        """Returns the total size of the stored arrays."""
+        return self.db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    @staticmethod
+    def key(*parts):
+        """Combines parts into a compact key."""
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Returns the array stored for the key.
+
+        Args:
+            key: The key.
+
+        Returns:
+            The array or None if there is none.
+        """
+        with self.lock:
+            row = self.db.execute('SELECT value FROM results WHERE key = ?',
+                                  (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute('UPDATE results SET used = ? WHERE key = ?',
+                            (time.time(), key))
+            self.db.commit()
+        return np.load(io.BytesIO(row[0]), allow_pickle=False)
+
+    def put(self, key, value):
+        """Stores an array and evicts old entries if needed.
+
+        The total size is tracked incrementally and only recounted before
+        evicting, as other processes may share the file.
+
+        Args:
+            key: The key.
+            value: The array.
+        """
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(value), allow_pickle=False)
+        data = buffer.getvalue()
+        with self.lock:
+            row = self.db.execute('SELECT size FROM results WHERE key = ?',
+                                  (key,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO results VALUES '
+                            '(?, ?, ?, ?)', (key, data, len(data),
+                                             time.time()))
+            self.total += len(data) - (row[0] if row else 0)
+            if self.total > self.max_bytes:
+                self.total = self.size()
+                if self.total > self.max_bytes:
+                    self.total -= self.evict(self.total - self.max_bytes)
+            self.db.commit()
+
+    def evict(self, excess):
+        """Deletes least recently used entries until at least excess bytes
+        are freed. Must be called with the lock held.
+
+        Returns:
+            The number of freed bytes.
+        """
+        freed = 0
+        keys = []
+        for key, size in self.db.execute(
+                'SELECT key, size FROM results ORDER BY used'):
+            if freed >= excess:
+                break
+            keys.append((key,))
+            freed += size
+        self.db.executemany('DELETE FROM results WHERE key = ?', keys)
+        return freed
+
+    def close(self):
+        """Commits pending changes and closes the file."""
+        with self.lock:
+            if self.db is not None:
+                self.db.commit()
+                self.db.close()
+                self.db = None
+
+
+class CachedFunction:
+    """Serves the results of a deterministic function from a `ResultCache`.
+
+    Results are keyed by the source, the frame number, and the function with
+    its parameters, so changing a parameter leads to recomputation. The frame
+    number is counted by calls, so frames must be passed in order, starting
+    with the first frame of the source. Callers which skip frames set
+    `frame` to the number of the next frame before calling (cvloop does so).
+
+    If the function provides `analyze(image)` and `render(image, result)`,
+    only the lightweight result of analyze is cached (e.g. the faces of
+    `DrawHat`) and render is always called. Otherwise the processed frames
+    are cached.
+    """
+
+    def __init__(self, function, cache, source):
+        """Initializes the `CachedFunction`.
+
+        Args:
+            function: The deterministic function.
+            cache: A `ResultCache` or the path of its file.
+            source: The source key, see source_key.
+        """
+        self.function = function
+        self.cache = cache if isinstance(cache, ResultCache) \
+            else ResultCache(cache)
+        self.source = source
+        self.function_key = function_key(function)
+        self.frame = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, image):
+        """Returns the cached result for the current frame or computes and
+        stores it.
+
+        Args:
+            image: The image.
+
+        Returns:
+            The processed image.
+        """
+        key = self.cache.key(self.source, self.frame, self.function_key)
+        self.frame += 1
+        lightweight = hasattr(self.function, 'analyze') and \
+            hasattr(self.function, 'render')
+
+        result = self.cache.get(key)
+        if result is None:
+            self.misses += 1
+            result = (self.function.analyze(image) if lightweight
+                      else self.function(image))
+            self.cache.put(key, result)
+        else:
+            self.hits += 1
+        return self.function.render(image, result) if lightweight else result
+
+    def close(self):
+        """Closes the cache and the function, if possible."""
+        self.cache.close()
+        try:
+            self.function.close()
+        except AttributeError:
+            pass
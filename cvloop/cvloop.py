@@ -4,7 +4,10 @@ It automatically selects the notebook backend for matplotlib, if the
 default notebook backend (inline) is detected.
 """
 
+import collections
+import functools
 import itertools
+import time
 
 from IPython.core.getipython import get_ipython
 from IPython.core.magics.pylab import PylabMagics
@@ -21,17 +24,27 @@ NavigationIPy.pause = lambda self: self.canvas.callbacks.process('pause_event')
 # pragma pylint: disable=wrong-import-position
 import matplotlib.pyplot as plt  # noqa: E402
 import matplotlib.animation as animation  # noqa: E402
+import matplotlib.colors as colors  # noqa: E402
 import matplotlib.image as image  # noqa: E402
 import matplotlib.patches as patches  # noqa: E402
 # pragma pylint: enable=wrong-import-position
 
+from .annotations import Annotations
+from .buffers import FramePool
+from .cache import CachedFunction, source_key
+from .metrics import Metrics
+from .offline import is_batched, open_capture
+from .parallel import ProcessPool
+from .regions import RegionOfInterest
+
 
 def prepare_axes(axes, title, size, cmap=None):
     """Prepares an axes object for clean plotting.
 
     Removes x and y axes labels and ticks, sets the aspect ratio to be
     equal, uses the size to determine the drawing area and fills the image
-    with random colors as visual feedback.
+    with random colors as visual feedback. The random colors are a small
+    uint8 placeholder stretched over the whole axes.
 
     Creates an AxesImage to be shown inside the axes object and sets the
     needed properties.
@@ -61,12 +74,21 @@ def prepare_axes(axes, title, size, cmap=None):
     # prepare image data
     axes_image = image.AxesImage(axes, cmap=cmap,
                                  extent=(0, size[1], size[0], 0))
-    axes_image.set_data(np.random.random((size[0], size[1], 3)))
+    axes_image.set_data(placeholder())
 
     axes.add_image(axes_image)
     return axes_image
 
 
+def placeholder():
+    """Returns a small image of random colors.
+
+    Returns:
+        A 10x10 uint8 RGB image.
+    """
+    return np.random.randint(0, 256, (10, 10, 3), dtype=np.uint8)
+
+
 def is_color_image(frame):
     """Checks if an image is a color image.
 
@@ -96,6 +118,174 @@ def to_gray(frame):
     return np.dot(frame[..., :3], [.299, .587, .114])
 
 
+def copy_frame(frame):
+    """Copies a frame, which may be a numpy array or a `cv2.UMat`.
+
+    Returns:
+        The copy.
+    """
+    if isinstance(frame, cv2.UMat):
+        return cv2.copyTo(frame, None)
+    return frame.copy()
+
+
+def to_numpy(frame):
+    """Converts `cv2.UMat` frames to numpy arrays.
+
+    Returns:
+        The frame as a numpy array.
+    """
+    if isinstance(frame, cv2.UMat):
+        return frame.get()
+    return frame
+
+
+def frame_signature(frame, size=32):
+    """Computes a thumbnail of a frame to cheaply compare frames.
+
+    Args:
+        frame: The frame, a numpy array or a `cv2.UMat`.
+        size: The width and height of the thumbnail. (Default: 32)
+
+    Returns:
+        The thumbnail as a float32 array, averaged over the areas of the
+        frame.
+    """
+    try:
+        thumbnail = cv2.resize(frame, (size, size),
+                               interpolation=cv2.INTER_AREA)
+    except cv2.error:
+        # Not supported by OpenCV, e.g. int64 frames: sample pixels instead.
+        frame = to_numpy(frame)
+        thumbnail = frame[::max(1, frame.shape[0] // size),
+                          ::max(1, frame.shape[1] // size)]
+    return np.asarray(to_numpy(thumbnail), dtype=np.float32)
+
+
+@functools.lru_cache()
+def colormap_lut(cmap):
+    """Creates a lookup table for a color map.
+
+    Args:
+        cmap: A matplotlib color map or its name.
+
+    Returns:
+        A uint8 lookup table of shape (256, 1, 3) to be used with cv2.LUT on
+        three channel images.
+    """
+    values = plt.get_cmap(cmap)(np.linspace(0, 1, 256))[:, :3]
+    return np.round(values * 255).astype(np.uint8).reshape(256, 1, 3)
+
+
+class DisplayConverter:
+    """Converts frames to uint8 RGB images ready to be displayed.
+
+    The conversion is chosen once, when the first frame arrives, and only
+    chosen again if the number of channels or the dtype of the frames change:
+
+    - color images without color map are shown as they are (floating point
+      images are scaled from 0-1 to 0-255, other integer images are clipped
+      to 0-255),
+    - all other images are converted to gray scale, scaled to 0-255 using the
+      value range of the first frame (like matplotlib's autoscaling), and
+      mapped with a precomputed lookup table of the color map (or `gray`).
+    """
+
+    def __init__(self, cmap=None):
+        """Initializes the `DisplayConverter`.
+
+        Args:
+            cmap: The color map or None.
+        """
+        self.cmap = cmap
+        self.key = None
+        self.convert = None
+
+    def __call__(self, frame):
+        """Converts the frame for display.
+
+        Args:
+            frame: The frame.
+
+        Returns:
+            The converted frame.
+        """
+        if frame.dtype == np.bool_:
+            frame = frame.view(np.uint8)
+        key = (frame.shape[2:], frame.dtype)
+        if key != self.key:
+            self.key = key
+            self.convert = self.resolve(frame)
+        return self.convert(frame)
+
+    def resolve(self, frame):
+        """Chooses the conversion for frames like this one.
+
+        Args:
+            frame: The frame.
+
+        Returns:
+            A function converting frames.
+        """
+        if self.cmap is None and is_color_image(frame):
+            if np.issubdtype(frame.dtype, np.floating):
+                return lambda f: cv2.convertScaleAbs(np.clip(f, 0, 1),
+                                                     alpha=255)
+            if frame.dtype != np.uint8:
+                # Like matplotlib, clip other integer images to 0-255.
+                return lambda f: np.clip(f, 0, 255).astype(np.uint8)
+            return lambda f: f
+
+        lut = colormap_lut('gray' if self.cmap is None else self.cmap)
+        gray = self.to_gray(frame)
+        low, high = float(np.min(gray)), float(np.max(gray))
+        alpha = 255 / (high - low) if high > low else 1
+        beta = -low * alpha
+
+        def convert(f):
+            """Scales the gray image to uint8 and applies the lookup table."""
+            f = cv2.addWeighted(self.to_gray(f), alpha, 0, 0, beta,
+                                dtype=cv2.CV_8U)
+            return cv2.LUT(cv2.cvtColor(f, cv2.COLOR_GRAY2RGB), lut)
+        return convert
+
+    @staticmethod
+    def to_gray(frame):
+        """Converts color images to single channel gray scale images.
+
+        Uses cv2.cvtColor where possible, otherwise falls back to to_gray.
+        """
+        if not is_color_image(frame):
+            frame = frame.reshape(frame.shape[:2])
+            if frame.dtype in (np.int64, np.uint32, np.uint64):
+                # Not supported by OpenCV.
+                return frame.astype(np.float64)
+            return frame
+        if frame.dtype in (np.uint8, np.uint16, np.float32):
+            code = (cv2.COLOR_RGBA2GRAY if frame.shape[2] == 4 else
+                    cv2.COLOR_RGB2GRAY)
+            if frame.shape[2] in (3, 4):
+                return cv2.cvtColor(frame, code)
+        return to_gray(frame)
+
+
+def frame_color(color, frame):
+    """Converts a matplotlib color into a color value for a frame converted
+    for display.
+
+    Args:
+        color: Any color matplotlib understands.
+        frame: The uint8 RGB(A) frame the color will be drawn on, see
+               DisplayConverter.
+
+    Returns:
+        A tuple of channel values usable by OpenCV's drawing functions,
+        opaque for frames with an alpha channel.
+    """
+    values = [round(v * 255) for v in colors.to_rgb(color)]
+    return tuple(values + [255] * (frame.shape[2] - 3))
+
+
 class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-name, too-many-instance-attributes
     """Uses a TimedAnimation to efficiently render video sources with blit."""
 
@@ -105,7 +295,11 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
                  annotations_default={'shape': 'RECT',
                                       'color': '#228B22',
                                       'line': 2,
-                                      'size': (20, 20)}):
+                                      'size': (20, 20)},
+                 burn_annotations=False, processes=None, latest_frame=False,
+                 max_latency=0.1, roi=None, motion_gate=False, umat=False,
+                 exporters=None, cache=None, frame_buffers=4,
+                 duplicate_threshold=None):
         """Runs a video loop for the specified source and modifies the stream
         with the function.
 
@@ -145,10 +339,11 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
                    second value for the modified image. If cmaps is a tuple,
                    None-entries are ignored and result in the normal guessing.
             print_info: If True, prints some info about the resource:
-                        dimensions, color channels, data type. Skips the output
-                        of one frame.
-            annotations: A list or tuple of annotations. Each annotation is a
-                         list or tuple in turn of this format:
+                        dimensions, color channels, data type.
+            annotations: A list or tuple of annotations, or an instance of
+                         cvloop.Annotations for large, columnar annotation
+                         sets. Each annotation is a list or tuple in turn of
+                         this format:
                              [x, y, frame, options]
                          x: the x coordinate of the center
                          y: the y coordinate of the center
@@ -167,6 +362,79 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
                         color: '#228B22', (forestgreen)
                         line: 2,
                         size: (20, 20)
+            burn_annotations: If True, annotations are drawn directly into the
+                              processed frame, after its conversion to RGB
+                              for display, using OpenCV instead of being
+                              added as matplotlib patches. Line widths and
+                              sizes are then given in pixels.
+                              (Default: False)
+            processes: If set, the function is run in this many worker
+                       processes (see cvloop.ProcessPool), frames are passed
+                       via shared memory. The workers inherit the function,
+                       which requires the `fork` start method; otherwise
+                       pass a cvloop.ProcessPool created from the function's
+                       name as function. The processed frames lag behind by
+                       `processes - 1` frames: the processed image is only
+                       drawn once the first result arrives, and the last
+                       frames are drawn in order when the source ends.
+                       (Default: None)
+            latest_frame: If True and the source supports `grab`, stale frames
+                          buffered by the driver are skipped and only the
+                          newest frame is retrieved and processed. This keeps
+                          the latency of live sources low if the function is
+                          slower than the source. The number of skipped frames
+                          is shown in the info line.
+                          (Default: False)
+            max_latency: The time in seconds between two reads after which
+                         buffered frames are considered stale if latest_frame
+                         is True.
+                         (Default: 0.1)
+            roi: If set, the function is only applied to regions of interest
+                 (see cvloop.RegionOfInterest): either a list of rectangles
+                 (x, y, width, height) or a boolean mask of the frame size.
+                 (Default: None)
+            motion_gate: If True and roi is set, regions without foreground
+                         motion reuse their previous result instead of being
+                         processed again.
+                         (Default: False)
+            umat: If True, frames are passed to the function as `cv2.UMat`
+                  and only converted to numpy arrays for display. This lets
+                  OpenCV's transparent API (e.g. OpenCL) process chains of
+                  OpenCV calls without intermediate copies. The function must
+                  accept `cv2.UMat` frames, numpy-based functions, roi and
+                  batched functions do not.
+                  (Default: False)
+            exporters: A list of metrics exporters, e.g.
+                       cvloop.PrometheusExporter or cvloop.JSONLinesExporter,
+                       which publish self.metrics: frame counts, stage
+                       latencies, queue depths and frame buffer sizes.
+                       (Default: None)
+            cache: A cvloop.ResultCache or the path of its file. If set, the
+                   results of the function are cached per source, frame and
+                   function parameters (see cvloop.CachedFunction), so
+                   replays skip the computation. Only use it with
+                   deterministic functions and identifiable sources (video
+                   files or sources with a cache_key). Can not be combined
+                   with processes or latest_frame.
+                   (Default: None)
+            frame_buffers: The number of preallocated buffers frames are
+                           read and color converted into (see
+                           cvloop.FramePool). Buffers are only reused once
+                           neither the function nor the display reference
+                           them. 0 allocates new arrays for every frame.
+                           Ignored for umat.
+                           (Default: 4)
+            duplicate_threshold: If set, frames whose signature (see
+                                 frame_signature) differs from the last
+                                 processed frame by at most this mean
+                                 absolute difference are not processed: the
+                                 previous result is reused and, unless there
+                                 are annotations, nothing is redrawn. The
+                                 frame number still advances. 0 only skips
+                                 frames with identical signatures. Skipped
+                                 frames are counted in
+                                 self.stats['duplicates'].
+                                 (Default: None)
         """
         if plt.get_backend() in (
                 'module://ipykernel.pylab.backend_inline',
@@ -177,30 +445,64 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
                     conf.matplotlib(line='notebook')
                     conf.matplotlib(line='notebook')
 
-        if source is not None:
-            if isinstance(source, type(cv2.VideoCapture())) \
-                    or hasattr(source, 'read'):
-                self.capture = source
-            else:
-                self.capture = cv2.VideoCapture(source)
-        else:
-            self.capture = cv2.VideoCapture(0)
+        self.capture = open_capture(source)
 
         self.figure = plt.figure()
         self.connect_event_handlers()
 
-        self.function = function
+        if roi is not None:
+            function = RegionOfInterest(function, roi,
+                                        motion_gate=motion_gate)
+        if cache is not None:
+            if processes:
+                raise ValueError('cache and processes can not be combined.')
+            if latest_frame:
+                # Skipped frames are not counted by the frame numbers.
+                raise ValueError('cache and latest_frame can not be '
+                                 'combined.')
+            key = source_key(source)
+            if key is None:
+                raise ValueError('The source {!r} can not be identified for '
+                                 'caching.'.format(source))
+            function = CachedFunction(function, cache, key)
+        self.cached = function if cache is not None else None
+        self.function = (ProcessPool(function, processes) if processes
+                         else function)
         self.convert_color = convert_color
+        self.umat = umat
 
-        self.annotations = (None if not annotations else
-                            sorted(annotations, key=lambda a: a[2]))
+        if isinstance(annotations, Annotations):
+            self.annotations = annotations
+        else:
+            self.annotations = (None if not annotations else
+                                sorted(annotations, key=lambda a: a[2]))
         self.annotations_default = annotations_default
         self.annotation_artists = []
+        self.burn_annotations = burn_annotations
 
         self.original = None
         self.processed = None
 
         self.frame_offset = 0
+        self.peeked = None
+        self.duplicate_threshold = duplicate_threshold
+        self.signature = None
+        self.previous = None
+        self.stats = collections.Counter()
+        if frame_buffers and not umat:
+            self.read_buffers = FramePool(frame_buffers)
+            self.convert_buffers = FramePool(frame_buffers)
+        else:
+            self.read_buffers = self.convert_buffers = None
+
+        self.metrics = Metrics()
+        self.exporters = list(exporters or [])
+        for exporter in self.exporters:
+            exporter.attach(self.metrics)
+
+        self.latest_frame = latest_frame and hasattr(self.capture, 'grab')
+        self.max_latency = max_latency
+        self.last_read = None
 
         try:
             self.cmap_original = cmaps if isinstance(cmaps, str) else cmaps[0]
@@ -222,6 +524,9 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
             self.print_info(self.capture)
 
         self.size = self.determine_size(self.capture)
+        self.frame_interval = 1 / self.determine_fps(self.capture)
+        self.convert_original = DisplayConverter(self.cmap_original)
+        self.convert_processed = DisplayConverter(self.cmap_processed)
         self.original = prepare_axes(axes_original, 'Original',
                                      self.size, self.cmap_original)
         self.processed = prepare_axes(axes_processed, 'Processed',
@@ -240,11 +545,19 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
         self.figure.canvas.mpl_connect('pause_event', self.evt_toggle_pause)
 
     def evt_release(self, *args):  # pylint: disable=unused-argument
-        """Tries to release the capture."""
+        """Tries to release the capture and closes the function if possible,
+        e.g. to stop worker processes."""
         try:
             self.capture.release()
         except AttributeError:
             pass
+        try:
+            self.function.close()
+        except AttributeError:
+            pass
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
 
     def evt_toggle_pause(self, *args):  # pylint: disable=unused-argument
         """Pauses and resumes the video source."""
@@ -253,17 +566,34 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
         else:
             self.event_source.stop()
 
+    def peek_frame(self, capture):
+        """Reads the first frame of the capture without consuming it.
+
+        The frame is cached and returned by the next call to read_frame, so
+        no frame is lost and frame numbers stay aligned with the source.
+
+        Args:
+            capture: the source to read from.
+
+        Returns:
+            The same as `capture.read()`: A success flag and the frame.
+        """
+        if self.peeked is None:
+            self.peeked = capture.read()
+            if self.peeked[0] and self.read_buffers is not None:
+                self.read_buffers.put(self.peeked[1])
+        return self.peeked
+
     def print_info(self, capture):
         """Prints information about the unprocessed image.
 
-        Reads one frame from the source to determine image colors, dimensions
-        and data types.
+        Peeks at the first frame of the source to determine image colors,
+        dimensions and data types.
 
         Args:
             capture: the source to read from.
         """
-        self.frame_offset += 1
-        ret, frame = capture.read()
+        ret, frame = self.peek_frame(capture)
         if ret:
             print('Capture Information')
             print('\tDimensions (HxW): {}x{}'.format(*frame.shape[0:2]))
@@ -282,8 +612,8 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
         640x480, thus returns (480, 640).
         If capture has a get method it is assumed to understand
         `cv2.CAP_PROP_FRAME_WIDTH` and `cv2.CAP_PROP_FRAME_HEIGHT` to get the
-        information. Otherwise it reads one frame from the source to determine
-        image dimensions.
+        information. Otherwise it peeks at the first frame of the source to
+        determine image dimensions.
 
         Args:
             capture: the source to read from.
@@ -297,18 +627,35 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
             width = capture.get(cv2.CAP_PROP_FRAME_WIDTH)
             height = capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
         else:
-            self.frame_offset += 1
-            ret, frame = capture.read()
+            ret, frame = self.peek_frame(capture)
             if ret:
                 width = frame.shape[1]
                 height = frame.shape[0]
         return (int(height), int(width))
 
+    def determine_fps(self, capture):  # pylint: disable=no-self-use
+        """Determines the frame rate of the image source.
+
+        If capture has a get method it is assumed to understand
+        `cv2.CAP_PROP_FPS`. If no frame rate is available, this method
+        defaults to 30.
+
+        Args:
+            capture: the source to query.
+
+        Returns:
+            The frames per second.
+        """
+        fps = 0
+        if capture and hasattr(capture, 'get'):
+            fps = capture.get(cv2.CAP_PROP_FPS)
+        return fps if fps and fps > 0 else 30
+
     def new_frame_seq(self):
         """Returns an endless frame counter.
 
-        Starts at self.frame_offset, in case some methods had to read frames
-        beforehand to gather information.
+        Starts at self.frame_offset. Frames read beforehand to gather
+        information are peeked and not discarded, so this is 0.
 
         This function is called by TimedAnimation.
 
@@ -324,43 +671,205 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
         This function is called by TimedAnimation.
         """
         if self.original is not None:
-            self.original.set_data(np.random.random((10, 10, 3)))
-        self.processed.set_data(np.random.random((10, 10, 3)))
+            self.original.set_data(placeholder())
+        self.processed.set_data(placeholder())
 
     def read_frame(self):
         """Reads a frame and converts the color if needed.
 
+        A frame peeked at during startup is returned first.
+
         In case no frame is available, i.e. self.capture.read() returns False
         as the first return value, the event_source of the TimedAnimation is
-        stopped, and if possible the capture source released.
+        stopped, and if possible the capture source and function released.
 
         Returns:
             None if stopped, otherwise the color converted source image.
         """
-        ret, frame = self.capture.read()
+        if self.peeked is not None:
+            ret, frame = self.peeked
+            self.peeked = None
+        elif self.latest_frame:
+            ret, frame = self.read_latest_frame()
+        else:
+            ret, frame = self.read_into_buffer(self.capture.read)
         if not ret:
             self.event_source.stop()
-            try:
-                self.capture.release()
-            except AttributeError:
-                # has no release method, thus just pass
-                pass
+            self.draw_pending()
+            self.evt_release()
             return None
-        if self.convert_color != -1 and is_color_image(frame):
-            return cv2.cvtColor(frame, self.convert_color)
+        color = is_color_image(frame)
+        if self.umat:
+            frame = cv2.UMat(frame)
+        if self.convert_color != -1 and color:
+            if self.convert_buffers is None:
+                return cv2.cvtColor(frame, self.convert_color)
+            converted = cv2.cvtColor(frame, self.convert_color,
+                                     dst=self.convert_buffers.get())
+            self.convert_buffers.put(converted)
+            return converted
         return frame
 
+    def read_into_buffer(self, read):
+        """Reads a frame into a buffer of self.read_buffers.
+
+        Falls back to allocating reads if no buffer is free or the capture
+        does not accept output arrays.
+
+        Args:
+            read: `capture.read` or `capture.retrieve`.
+
+        Returns:
+            The same as `capture.read()`: A success flag and the frame.
+        """
+        buffer = None if self.read_buffers is None else self.read_buffers.get()
+        if buffer is None:
+            ret, frame = read()
+        else:
+            try:
+                ret, frame = read(image=buffer)
+            except TypeError:
+                # The capture does not support output arrays.
+                self.read_buffers = None
+                ret, frame = read()
+        if ret and self.read_buffers is not None:
+            self.read_buffers.put(frame)
+        return ret, frame
+
+    def draw_pending(self):
+        """Draws the frames a pipelined function (see cvloop.ProcessPool)
+        still holds at the end of the stream."""
+        try:
+            pending = self.function.drain()
+        except AttributeError:
+            return
+        for processed in pending:
+            self.processed.set_data(self.convert_processed(processed))
+            self.metrics.count('frames_processed')
+            self.metrics.count('frames_displayed')
+
+    def read_latest_frame(self):
+        """Skips stale buffered frames and retrieves the newest frame.
+
+        If more than self.max_latency seconds passed since the last read,
+        frames are grabbed (but not decoded) until either as many frames as
+        the source delivered in the meantime are grabbed or a grab blocks,
+        i.e. the driver buffer is drained. Only the last grabbed frame is
+        retrieved. Skipped frames are counted in self.stats['skipped'].
+
+        Returns:
+            The same as `capture.read()`: A success flag and the frame.
+        """
+        now = time.perf_counter()
+        elapsed = 0 if self.last_read is None else now - self.last_read
+        stale = 0
+        if elapsed > self.max_latency:
+            stale = int(elapsed / self.frame_interval)
+
+        ret = self.capture.grab()
+        while ret and stale > 0:
+            start = time.perf_counter()
+            ret = self.capture.grab()
+            stale -= 1
+            self.stats['skipped'] += 1
+            self.metrics.count('frames_dropped')
+            if time.perf_counter() - start > self.frame_interval / 2:
+                # The grab had to wait for a new frame: the buffer is empty.
+                break
+
+        self.last_read = time.perf_counter()
+        if not ret:
+            return False, None
+        return self.read_into_buffer(self.capture.retrieve)
+
     def process_frame(self, frame):
         """Processes a frame with the user specified function.
 
+        Batched functions (see cvloop.is_batched) are called with a stack of
+        one frame, which is unpacked again, unless the frame is a `cv2.UMat`.
+
         Args:
             frame: The input frame.
 
         Returns:
             The processed frame.
         """
+        if is_batched(self.function) and not isinstance(frame, cv2.UMat):
+            return self.function(frame[np.newaxis])[0]
         return self.function(frame)
 
+    def is_duplicate(self, frame):
+        """Checks if a frame hardly differs from the last processed frame.
+
+        The comparison is against the last frame which was not a duplicate,
+        so slow changes are not missed.
+
+        Args:
+            frame: The original frame.
+
+        Returns:
+            True if the previous result can be reused for the frame.
+        """
+        if self.duplicate_threshold is None:
+            return False
+        signature = frame_signature(frame)
+        if self.signature is not None and self.previous is not None and \
+                signature.shape == self.signature.shape and \
+                float(np.mean(np.abs(signature - self.signature))) <= \
+                self.duplicate_threshold:
+            return True
+        self.signature = signature
+        return False
+
+    def annotation_style(self, annotation):
+        """Resolves the style of an annotation.
+
+        Values missing from the annotation's options are taken from
+        self.annotations_default.
+
+        Args:
+            annotation: The annotation, [x, y, frame] or
+                        [x, y, frame, options].
+
+        Returns:
+            A tuple (shape, color, size, line).
+        """
+        shape = self.annotations_default['shape']
+        color = self.annotations_default['color']
+        size = self.annotations_default['size']
+        line = self.annotations_default['line']
+        if len(annotation) > 3:
+            shape = annotation[3].get('shape', shape)
+            color = annotation[3].get('color', color)
+            size = annotation[3].get('size', size)
+            line = annotation[3].get('line', line)
+        if shape == 'CIRC' and hasattr(size, '__len__'):
+            size = 30
+
+        if not hasattr(color, '__len__'):
+            color = (color,) * 3
+        return shape, color, size, line
+
+    def frame_annotations(self, framedata):
+        """Yields the annotations of the provided framedata.
+
+        Args:
+            framedata: The current frame number.
+
+        Yields:
+            Tuples (pos, shape, color, size, line) for each annotation.
+        """
+        if isinstance(self.annotations, Annotations):
+            for annotation in self.annotations.for_frame(
+                    framedata, self.annotations_default['shape']):
+                yield (annotation[0:2],) + self.annotation_style(annotation)
+            return
+        for annotation in self.annotations:
+            if annotation[2] > framedata:
+                return
+            if annotation[2] == framedata:
+                yield (annotation[0:2],) + self.annotation_style(annotation)
+
     def annotate(self, framedata):
         """Annotates the processed axis with given annotations for
         the provided framedata.
@@ -371,77 +880,140 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
         for artist in self.annotation_artists:
             artist.remove()
         self.annotation_artists = []
-        for annotation in self.annotations:
-            if annotation[2] > framedata:
-                return
-            if annotation[2] == framedata:
-                pos = annotation[0:2]
-                shape = self.annotations_default['shape']
-                color = self.annotations_default['color']
-                size = self.annotations_default['size']
-                line = self.annotations_default['line']
-                if len(annotation) > 3:
-                    shape = annotation[3].get('shape', shape)
-                    color = annotation[3].get('color', color)
-                    size = annotation[3].get('size', size)
-                    line = annotation[3].get('line', line)
-                if shape == 'CIRC' and hasattr(size, '__len__'):
-                    size = 30
-
-                if not hasattr(color, '__len__'):
-                    color = (color,) * 3
-
-                if shape == 'RECT':
-                    patch = patches.Rectangle((pos[0] - size[0] // 2,
-                                               pos[1] - size[1] // 2),
-                                              size[0], size[1], fill=False,
-                                              lw=line, fc='none', ec=color)
-                elif shape == 'CIRC':
-                    patch = patches.CirclePolygon(pos, radius=size, fc='none',
-                                                  ec=color, lw=line)
-                self.annotation_artists.append(patch)
-                self.axes_processed.add_artist(self.annotation_artists[-1])
+        for pos, shape, color, size, line in self.frame_annotations(framedata):
+            if shape == 'RECT':
+                patch = patches.Rectangle((pos[0] - size[0] // 2,
+                                           pos[1] - size[1] // 2),
+                                          size[0], size[1], fill=False,
+                                          lw=line, fc='none', ec=color)
+            elif shape == 'CIRC':
+                patch = patches.CirclePolygon(pos, radius=size, fc='none',
+                                              ec=color, lw=line)
+            self.annotation_artists.append(patch)
+            self.axes_processed.add_artist(self.annotation_artists[-1])
+
+    def annotate_frame(self, frame, framedata):
+        """Draws the annotations for the provided framedata into the frame.
+
+        Unlike annotate, this does not create matplotlib artists but uses
+        cv2.rectangle and cv2.circle to draw the annotations in place. The
+        frame is the processed frame converted for display, so the colors
+        are shown as they are regardless of the processed frame's dtype and
+        value range.
+
+        Args:
+            frame: The uint8 RGB(A) frame, see DisplayConverter.
+            framedata: The current frame number.
+
+        Returns:
+            The annotated frame. This is the frame itself, unless it had to be
+            copied to be drawn on.
+        """
+        if not frame.flags.writeable or not frame.flags.c_contiguous:
+            frame = np.ascontiguousarray(frame).copy()
+        for pos, shape, color, size, line in self.frame_annotations(framedata):
+            color = frame_color(color, frame)
+            x, y = int(pos[0]), int(pos[1])
+            if shape == 'RECT':
+                left = x - int(size[0]) // 2
+                top = y - int(size[1]) // 2
+                cv2.rectangle(frame, (left, top),
+                              (left + int(size[0]), top + int(size[1])),
+                              color, int(line))
+            elif shape == 'CIRC':
+                cv2.circle(frame, (x, y), int(size), color, int(line))
+        return frame
 
     def _draw_frame(self, framedata):
         """Reads, processes and draws the frames.
 
-        If needed for color maps, conversions to gray scale are performed. In
-        case the images are no color images and no custom color maps are
-        defined, the colormap `gray` is applied.
+        The frames are converted to uint8 RGB images for display (see
+        DisplayConverter): If needed for color maps, conversions to gray scale
+        are performed. In case the images are no color images and no custom
+        color maps are defined, the colormap `gray` is applied.
 
         This function is called by TimedAnimation.
 
         Args:
             framedata: The frame data.
         """
+        start = time.perf_counter()
         original = self.read_frame()
         if original is None:
             self.update_info(self.info_string(message='Finished.',
                                               frame=framedata))
             return
-
-        if self.original is not None:
-            processed = self.process_frame(original.copy())
-
-            if self.cmap_original is not None:
-                original = to_gray(original)
-            elif not is_color_image(original):
-                self.original.set_cmap('gray')
-            self.original.set_data(original)
+        read = time.perf_counter()
+        self.metrics.observe('read', read - start)
+        self.metrics.count('frames_read')
+
+        if self.is_duplicate(original):
+            self.stats['duplicates'] += 1
+            self.metrics.count('frames_duplicate')
+            if not self.annotations:
+                self.update_info(self.info_string(frame=framedata))
+                self.record_metrics(original, self.previous)
+                return
+            processed = self.previous
         else:
-            processed = self.process_frame(original)
-
-        if self.cmap_processed is not None:
-            processed = to_gray(processed)
-        elif not is_color_image(processed):
-            self.processed.set_cmap('gray')
-
+            if self.cached is not None:
+                # Duplicates are not processed, keep the keys aligned.
+                self.cached.frame = framedata
+            if self.original is not None:
+                processed = self.process_frame(copy_frame(original))
+                self.original.set_data(
+                    self.convert_original(to_numpy(original)))
+            else:
+                processed = self.process_frame(original)
+            if processed is None:
+                # A pipelined function (see cvloop.ProcessPool) is filling up.
+                self.update_info(self.info_string(frame=framedata))
+                self.record_metrics(original, None)
+                return
+            processed = to_numpy(processed)
+            if self.duplicate_threshold is not None:
+                self.previous = processed
+            self.metrics.count('frames_processed')
+        process = time.perf_counter()
+        self.metrics.observe('process', process - read)
+
+        display = self.convert_processed(processed)
         if self.annotations:
-            self.annotate(framedata)
+            if self.burn_annotations:
+                if np.may_share_memory(display, processed):
+                    # Do not draw into the function's result.
+                    display = display.copy()
+                display = self.annotate_frame(display, framedata)
+            else:
+                self.annotate(framedata)
 
-        self.processed.set_data(processed)
+        self.processed.set_data(display)
 
         self.update_info(self.info_string(frame=framedata))
+        self.metrics.observe('display', time.perf_counter() - process)
+        self.metrics.count('frames_displayed')
+        self.record_metrics(original, processed)
+
+    def record_metrics(self, original, processed):
+        """Updates the gauges and counters which are not tied to a stage and
+        passes the metrics to the exporters.
+
+        Args:
+            original: The original frame.
+            processed: The processed frame, None if there is none yet.
+        """
+        self.metrics.gauge('queue_depth',
+                           len(getattr(self.function, 'pending', ())))
+        pools = [pool for pool in (self.read_buffers, self.convert_buffers)
+                 if pool is not None]
+        pooled = sum(pool.nbytes for pool in pools)
+        if not any(buffer is original for pool in pools
+                   for buffer in pool.buffers):
+            pooled += getattr(original, 'nbytes', 0)
+        self.metrics.gauge('frame_buffer_bytes',
+                           pooled + getattr(processed, 'nbytes', 0))
+        for exporter in self.exporters:
+            exporter.export(self.metrics)
 
     def update_info(self, custom=None):
         """Updates the figure's suptitle.
@@ -457,7 +1029,9 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
         """Returns information about the stream.
 
         Generates a string containing size, frame number, and info messages.
-        Omits unnecessary information (e.g. empty messages and frame -1).
+        Omits unnecessary information (e.g. empty messages and frame -1)
+        and appends the nonzero counts of self.stats (e.g. skipped and
+        duplicate frames).
 
         This method is primarily used to update the suptitle of the plot
         figure.
@@ -472,6 +1046,9 @@ class cvloop(animation.TimedAnimation):  # noqa: E501 pylint: disable=invalid-na
             info.append('Size: {1}x{0}'.format(*self.size))
         if frame >= 0:
             info.append('Frame: {}'.format(frame))
+        for name, count in sorted(self.stats.items()):
+            if count:
+                info.append('{}: {}'.format(name.capitalize(), count))
         if message != '':
             info.append('{}'.format(message))
         return ' '.join(info)
@@ -0,0 +1,25 @@
+"""Creates cvloop functions from their names, e.g. in worker processes or
+from the command line."""
+
+import importlib
+
+from . import functions
+
+
+def create_function(name, kwargs=None):
+    """Creates a function from its name and keyword arguments.
+
+    Args:
+        name: Either the name of a class in cvloop.functions or an import
+              path like `package.module:Class`.
+        kwargs: The keyword arguments for the constructor.
+
+    Returns:
+        The function instance.
+    """
+    if ':' in name:
+        module, name = name.split(':', 1)
+        factory = getattr(importlib.import_module(module), name)
+    else:
+        factory = getattr(functions, name)
+    return factory(**(kwargs or {}))
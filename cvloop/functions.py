@@ -1,6 +1,23 @@
-"""Provides ready to use example functions for the cvloop."""
-
+"""Provides ready to use example functions for the cvloop.
+
+Concurrency: The functions in this module can be called from multiple
+threads. Stateful functions (background subtractors, face detection)
+serialize concurrent calls on one instance with a lock, as their state
+belongs to a single stream. To process several streams in parallel, create
+one instance per stream or thread, e.g. using `clone()`. The heavy work is
+done in OpenCV calls, which release the GIL.
+
+UMat: The background subtractors, `ForegroundExtractor` and `Inverter` also
+accept `cv2.UMat` images and return `cv2.UMat` results, so that OpenCV's
+transparent API can process whole chains without copies to numpy arrays.
+`DrawHat` converts `cv2.UMat` images to numpy arrays.
+"""
+
+import concurrent.futures
 import os
+import queue
+import threading
+
 import numpy as np
 import cv2
 
@@ -9,7 +26,10 @@ from . import OPENCV_CASCADE_PATH
 
 class ForegroundExtractor:
     """Performs background subtraction using the supplied Subtractor and
-    extracts the foreground accordingly."""
+    extracts the foreground accordingly.
+
+    Not shareable between streams: clones also clone the subtractor.
+    """
 
     def __init__(self, subtractor=None):
         """Initializes the `ForegroundExtractor`.
@@ -27,10 +47,109 @@ class ForegroundExtractor:
     def __call__(self, image):
         """Returns the foreground of the image in colors. The background is
         black."""
-        return image * (self.bg_sub(image) > 0)[:, :, np.newaxis]
+        return cv2.bitwise_and(image, image, mask=self.bg_sub(image))
+
+    def clone(self):
+        """Returns a new `ForegroundExtractor` with a clone of the
+        subtractor."""
+        return ForegroundExtractor(self.bg_sub.clone())
+
+
+class _BackgroundSubtractor:
+    """Common base of the background subtractors.
+
+    Optionally models the background on a downscaled and/or gray scale
+    version of the image and scales the mask back to the image size.
+
+    The background model belongs to one stream: concurrent calls are
+    serialized, use `clone()` to get an independent instance per stream.
+    """
+
+    # Runtime state, not parameters (see cvloop.cache.function_key).
+    cache_ignore = ('fgbg', 'frame', 'lock', 'umat_shape')
+
+    def __init__(self, fgbg, scale=1, grayscale=False, learning_rate=-1,
+                 update_every=1):
+        """Initializes the background subtractor.
+
+        Args:
+            fgbg: The OpenCV background subtractor.
+            scale: The factor to resize images with before the background
+                   subtraction. The mask is scaled back with nearest neighbor
+                   interpolation. (Default: 1)
+            grayscale: If True, color images are converted to gray scale
+                       before the background subtraction. (Default: False)
+            learning_rate: The learning rate passed to `fgbg.apply`. Negative
+                           values let OpenCV choose. (Default: -1)
+            update_every: Update the background model only every n-th frame,
+                          all other frames use a learning rate of 0.
+                          (Default: 1)
+        """
+        self.fgbg = fgbg
+        self.scale = scale
+        self.grayscale = grayscale
+        self.learning_rate = learning_rate
+        self.update_every = update_every
+        self.frame = 0
+        self.lock = threading.Lock()
+        self.umat_shape = None
+
+    def shape(self, image):
+        """Returns the shape of the image.
+
+        The shape of `cv2.UMat` images is not accessible without copying
+        them, so it is determined once from the first one and assumed to be
+        the same for all following images.
+        """
+        if not isinstance(image, cv2.UMat):
+            return image.shape
+        if self.umat_shape is None:
+            self.umat_shape = image.get().shape
+        return self.umat_shape
+
+    def shrink(self, image):
+        """Converts the image to the size and colors used for modeling."""
+        shape = self.shape(image)
+        if self.grayscale and len(shape) >= 3 and shape[2] >= 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        if self.scale != 1:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA)
+        return image
+
+    def grow(self, mask, image):
+        """Scales the mask back to the size of the image."""
+        if self.scale != 1:
+            shape = self.shape(image)
+            mask = cv2.resize(mask, (shape[1], shape[0]),
+                              interpolation=cv2.INTER_NEAREST)
+        return mask
+
+    def apply(self, image):
+        """Applies the background subtractor to the modeling image."""
+        with self.lock:
+            learning_rate = (self.learning_rate
+                             if self.frame % self.update_every == 0 else 0)
+            self.frame += 1
+            return self.fgbg.apply(image, learningRate=learning_rate)
+
+    def __call__(self, image):
+        """Returns a foreground mask of the image."""
+        return self.grow(self.apply(self.shrink(image)), image)
 
+    def options(self):
+        """Returns the keyword arguments this subtractor was created with."""
+        return {'scale': self.scale, 'grayscale': self.grayscale,
+                'learning_rate': self.learning_rate,
+                'update_every': self.update_every}
 
-class BackgroundSubtractorGMG:
+    def clone(self):
+        """Returns a new subtractor of the same type and options with a fresh
+        background model."""
+        return type(self)(**self.options())
+
+
+class BackgroundSubtractorGMG(_BackgroundSubtractor):
     """Performs background subtraction with a mixture of gaussians.
 
     The method used was described by Godbehere, Matsukawa, and Goldberg in
@@ -42,7 +161,7 @@ class BackgroundSubtractorGMG:
     http://docs.opencv.org/3.1.0/db/d5c/tutorial_py_bg_subtraction.html.
     """
 
-    def __init__(self, structuring_element=None):
+    def __init__(self, structuring_element=None, **kwargs):
         """Initializes the `BackgroundSubtractorGMG`.
 
         *Note:* Requires OpenCV to be built with `--contrib` as it uses the
@@ -51,22 +170,37 @@ class BackgroundSubtractorGMG:
         Unless a custom `structuring_element` is specified, it uses:
             `cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))`
 
+        The morphological opening is performed on the downscaled mask.
+
         Args:
             structuring_element: The structuring element.
+            scale: The factor to resize images with before the background
+                   subtraction. (Default: 1)
+            grayscale: If True, models the background in gray scale.
+                       (Default: False)
+            learning_rate: The learning rate, negative values let OpenCV
+                           choose. (Default: -1)
+            update_every: Update the model only every n-th frame.
+                          (Default: 1)
         """
         if structuring_element is None:
             self.strel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
         else:
             self.strel = structuring_element
-        self.fgbg = cv2.bgsegm.createBackgroundSubtractorGMG()  # noqa: E501 pylint: disable=no-member,line-too-long
+        super().__init__(cv2.bgsegm.createBackgroundSubtractorGMG(),  # noqa: E501 pylint: disable=no-member,line-too-long
+                         **kwargs)
 
     def __call__(self, image):
         """Returns a foreground mask of the image."""
-        return cv2.morphologyEx(self.fgbg.apply(image), cv2.MORPH_OPEN,
-                                self.strel)
+        return self.grow(cv2.morphologyEx(self.apply(self.shrink(image)),
+                                          cv2.MORPH_OPEN, self.strel), image)
 
+    def options(self):
+        """Returns the keyword arguments this subtractor was created with."""
+        return dict(super().options(), structuring_element=self.strel)
 
-class BackgroundSubtractorMOG:
+
+class BackgroundSubtractorMOG(_BackgroundSubtractor):
     """Performs background subtraction with a mixture of gaussians.
 
     The method used was described by KaewTraKulPong and Bowden in
@@ -78,20 +212,27 @@ class BackgroundSubtractorMOG:
     http://docs.opencv.org/3.1.0/db/d5c/tutorial_py_bg_subtraction.html.
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         """Initializes the `BackgroundSubtractorMOG`.
 
         *Note:* Requires OpenCV to be built with `--contrib` as it uses the
         `bgsegm` package.
-        """
-        self.fgbg = cv2.bgsegm.createBackgroundSubtractorMOG()  # noqa: E501 pylint: disable=no-member,line-too-long
 
-    def __call__(self, image):
-        """Returns a foreground mask of the image."""
-        return self.fgbg.apply(image)
+        Args:
+            scale: The factor to resize images with before the background
+                   subtraction. (Default: 1)
+            grayscale: If True, models the background in gray scale.
+                       (Default: False)
+            learning_rate: The learning rate, negative values let OpenCV
+                           choose. (Default: -1)
+            update_every: Update the model only every n-th frame.
+                          (Default: 1)
+        """
+        super().__init__(cv2.bgsegm.createBackgroundSubtractorMOG(),  # noqa: E501 pylint: disable=no-member,line-too-long
+                         **kwargs)
 
 
-class BackgroundSubtractorMOG2:
+class BackgroundSubtractorMOG2(_BackgroundSubtractor):
     """Performs background subtraction with a mixture of gaussians.
 
     The method used was described in two papers by Zivkovic and van der
@@ -106,17 +247,30 @@ class BackgroundSubtractorMOG2:
     http://docs.opencv.org/3.1.0/db/d5c/tutorial_py_bg_subtraction.html.
     """
 
-    def __init__(self):
-        """Initializes the `BackgroundSubtractorMOG2`."""
-        self.fgbg = cv2.createBackgroundSubtractorMOG2()
+    def __init__(self, **kwargs):
+        """Initializes the `BackgroundSubtractorMOG2`.
 
-    def __call__(self, image):
-        """Returns a foreground mask of the image."""
-        return self.fgbg.apply(image)
+        Args:
+            scale: The factor to resize images with before the background
+                   subtraction. (Default: 1)
+            grayscale: If True, models the background in gray scale.
+                       (Default: False)
+            learning_rate: The learning rate, negative values let OpenCV
+                           choose. (Default: -1)
+            update_every: Update the model only every n-th frame.
+                          (Default: 1)
+        """
+        super().__init__(cv2.createBackgroundSubtractorMOG2(), **kwargs)
 
 
 class Inverter:
-    """Inverts the colors of the image."""
+    """Inverts the colors of the image.
+
+    The `Inverter` is batched: it also accepts stacks of images. It is
+    stateless and can be shared between threads.
+    """
+
+    batched = True
 
     def __init__(self, high=255):
         """Initializes the `Inverter` with a high value.
@@ -129,7 +283,14 @@ class Inverter:
 
     def __call__(self, image):
         """Calculates the image negative, i.e. self.high - image."""
-        return 255 - image
+        if isinstance(image, cv2.UMat) or (self.high == 255 and
+                                           image.dtype == np.uint8):
+            return cv2.bitwise_not(image)
+        return self.high - image
+
+    def clone(self):
+        """Returns a new `Inverter` with the same high value."""
+        return Inverter(self.high)
 
 
 class DrawHat:
@@ -141,13 +302,27 @@ class DrawHat:
     The default hat (examples/hat.png) is taken from
     https://pixabay.com/en/hat-trilby-black-brim-crease-felt-157581/
     and was released unter CC0 Public Domain.
+
+    The cascade classifier is not thread-safe: concurrent face detections on
+    one instance are serialized, use `clone()` to get an instance with its own
+    classifier per thread.
+
+    For large frames, the detection can be split into overlapping tiles which
+    are searched in parallel by a thread pool, each thread with its own
+    classifier. Faces up to the overlap are found in the tiles, larger faces
+    in an additional pass over the whole frame, and duplicates at the tile
+    borders are merged with `non_max_suppression`.
     """
 
+    # Runtime state, not parameters (see cvloop.cache.function_key).
+    cache_ignore = ('cascade', 'cascades', 'lock', 'pool')
+
     def __init__(self, hat_path=os.path.join(os.curdir, 'hat.png'),
                  cascade_path=os.path.join(
                      OPENCV_CASCADE_PATH, 'haarcascades',
                      'haarcascade_frontalface_default.xml'),
-                 w_offset=1.3, x_offset=-20, y_offset=80, draw_box=False):
+                 w_offset=1.3, x_offset=-20, y_offset=80, draw_box=False,
+                 tiles=None, overlap=.25, workers=None):
         # pragma pylint: disable=line-too-long
         """Initializes a `DrawHat` instance.
 
@@ -160,6 +335,13 @@ class DrawHat:
             x_offset: Number of pixels right to move hat.
             y_offset: Number of pixels down to move hat.
             draw_box: If True, draws boxes around detected faces.
+            tiles: The number of tiles per row and column, as an int or a
+                   tuple (rows, columns). None disables tiling.
+                   (Default: None)
+            overlap: The overlap of neighboring tiles as a fraction of the
+                     smaller tile side. (Default: .25)
+            workers: The number of threads for tiled detection.
+                     (Default: the number of tiles + 1)
         """
         # pragma pylint: enable=line-too-long
         self.w_offset = w_offset
@@ -167,8 +349,33 @@ class DrawHat:
         self.y_offset = y_offset
         self.draw_box = draw_box
 
+        self.hat_path = hat_path
+        self.cascade_path = cascade_path
         self.cascade = cv2.CascadeClassifier(cascade_path)
         self.hat = self.load_hat(hat_path)
+        self.lock = threading.Lock()
+
+        if isinstance(tiles, int):
+            tiles = (tiles, tiles)
+        self.tiles = tiles
+        self.overlap = overlap
+        self.workers = workers
+        # Created on first use, so forked processes do not share the pool.
+        self.pool = None
+        self.cascades = None
+
+    def clone(self):
+        """Returns a new `DrawHat` with the same settings and its own cascade
+        classifier."""
+        return DrawHat(self.hat_path, self.cascade_path, self.w_offset,
+                       self.x_offset, self.y_offset, self.draw_box,
+                       self.tiles, self.overlap, self.workers)
+
+    def close(self):
+        """Stops the threads of the tiled detection."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
     def load_hat(self, path):  # pylint: disable=no-self-use
         """Loads the hat from a picture at path.
@@ -197,12 +404,11 @@ class DrawHat:
             cascades.
         """
         frame_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        faces = self.cascade.detectMultiScale(
-            frame_gray,
-            scaleFactor=1.3,
-            minNeighbors=5,
-            minSize=(50, 50),
-            flags=0)
+        with self.lock:
+            if self.tiles is None:
+                faces = self.detect(self.cascade, frame_gray)
+            else:
+                faces = self.detect_tiled(frame_gray)
 
         if draw_box:
             for x, y, w, h in faces:
@@ -210,7 +416,122 @@ class DrawHat:
                               (x + w, y + h), (0, 255, 0), 2)
         return faces
 
-    def __call__(self, image):  # pylint: disable=too-many-locals
+    @staticmethod
+    def detect(cascade, frame_gray, max_size=None, min_size=50):
+        """Runs the cascade with the detection parameters of DrawHat.
+
+        Args:
+            cascade: The cascade classifier.
+            frame_gray: The gray scale image.
+            max_size: The maximum face size or None. (Default: None)
+            min_size: The minimum face size. (Default: 50)
+
+        Returns:
+            The faces as returned by detectMultiScale.
+        """
+        return cascade.detectMultiScale(
+            frame_gray,
+            scaleFactor=1.3,
+            minNeighbors=5,
+            minSize=(min_size, min_size),
+            maxSize=(max_size or 0, max_size or 0),
+            flags=0)
+
+    def detect_tiled(self, frame_gray):
+        """Detects faces in overlapping tiles in parallel.
+
+        Args:
+            frame_gray: The gray scale image.
+
+        Returns:
+            The merged faces as an array of (x, y, w, h) rows.
+        """
+        rows, columns = self.tiles
+        height, width = frame_gray.shape[:2]
+        tile_height = -(-height // rows)
+        tile_width = -(-width // columns)
+        margin = max(1, int(min(tile_height, tile_width) * self.overlap))
+
+        if self.pool is None:
+            workers = self.workers or rows * columns + 1
+            self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+            self.cascades = queue.Queue()
+            for _ in range(workers):
+                self.cascades.put(cv2.CascadeClassifier(self.cascade_path))
+
+        def run(left, top, right, bottom, max_size, min_size):
+            """Detects faces in a region with a free classifier."""
+            cascade = self.cascades.get()
+            try:
+                faces = self.detect(cascade, frame_gray[top:bottom,
+                                                        left:right],
+                                    max_size, min_size)
+            finally:
+                self.cascades.put(cascade)
+            return np.asarray(faces, dtype=np.int32).reshape(-1, 4) + \
+                (left, top, 0, 0)
+
+        tasks = [(max(0, column * tile_width - margin),
+                  max(0, row * tile_height - margin),
+                  min(width, (column + 1) * tile_width + margin),
+                  min(height, (row + 1) * tile_height + margin),
+                  margin, 50)
+                 for row in range(rows) for column in range(columns)]
+        # Faces larger than the margin may be cut by every tile.
+        tasks.append((0, 0, width, height, None, max(50, margin)))
+        results = list(self.pool.map(lambda task: run(*task), tasks))
+        return self.non_max_suppression(np.concatenate(results))
+
+    @staticmethod
+    def non_max_suppression(boxes, threshold=.3):
+        """Merges overlapping boxes, keeping the larger ones.
+
+        A box is dropped if its intersection with a larger kept box exceeds
+        threshold times the area of the smaller of both, which also removes
+        boxes lying inside others.
+
+        Args:
+            boxes: An array of (x, y, w, h) rows.
+            threshold: The maximum overlap of kept boxes. (Default: .3)
+
+        Returns:
+            The kept boxes as an int32 array of (x, y, w, h) rows.
+        """
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        boxes = boxes[np.argsort(-boxes[:, 2] * boxes[:, 3], kind='stable')]
+        kept = []
+        for box in boxes:
+            x, y, w, h = box
+            overlaps = False
+            for kx, ky, kw, kh in kept:
+                width = min(x + w, kx + kw) - max(x, kx)
+                height = min(y + h, ky + kh) - max(y, ky)
+                if width > 0 and height > 0 and \
+                        width * height > threshold * w * h:
+                    overlaps = True
+                    break
+            if not overlaps:
+                kept.append(box)
+        return np.array(kept, dtype=np.int32).reshape(-1, 4)
+
+    def analyze(self, image):
+        """Detects the faces in the image without drawing anything.
+
+        Together with render, this allows to cache the detected faces instead
+        of whole frames (see cvloop.CachedFunction).
+
+        Args:
+            image: The image.
+
+        Returns:
+            The faces as an array of (x, y, w, h) rows.
+        """
+        if isinstance(image, cv2.UMat):
+            image = image.get()
+        return np.asarray(self.find_faces(image), dtype=np.int32).reshape(-1,
+                                                                           4)
+
+    def __call__(self, image):
         """Draws a hat on top of detected faces inside the image.
 
         Args:
@@ -219,10 +540,28 @@ class DrawHat:
         Returns:
             The image with a hat.
         """
+        return self.render(image, self.analyze(image))
+
+    def render(self, image, faces):  # pylint: disable=too-many-locals
+        """Draws hats on top of the faces and, if self.draw_box is True,
+        boxes around them.
+
+        Args:
+            image: The image.
+            faces: The faces as returned by analyze.
+
+        Returns:
+            The image with a hat.
+        """
+        if isinstance(image, cv2.UMat):
+            image = image.get()
         frame_height = image.shape[0]
         frame_width = image.shape[1]
 
-        faces = self.find_faces(image, self.draw_box)
+        if self.draw_box:
+            for x, y, w, h in faces:
+                cv2.rectangle(image, (int(x), int(y)),
+                              (int(x + w), int(y + h)), (0, 255, 0), 2)
 
         for x, y, w, h in faces:  # pylint: disable=unused-variable
             hat = self.hat.copy()
@@ -254,13 +593,18 @@ class DrawHat:
                 hat_right = hat_width - (x1 - frame_width)
                 x1 = frame_width
 
-            # Remove background from hat image.
-            for c in range(0, 3):
-                hat_slice = hat[hat_top:hat_bottom, hat_left:hat_right, c] * \
-                    (hat[hat_top:hat_bottom, hat_left:hat_right, 3] / 255.0)
-                bg_slice = image[y0:y1, x0:x1, c] * \
-                    (1.0 - hat[hat_top:hat_bottom, hat_left:hat_right, 3]
-                     / 255.0)
-                image[y0:y1, x0:x1, c] = hat_slice + bg_slice
+            # Blend hat and background using the hat's alpha channel.
+            hat = hat[hat_top:hat_bottom, hat_left:hat_right]
+            alpha = hat[:, :, 3].astype(np.float32) / 255
+            if image.dtype == np.uint8:
+                image[y0:y1, x0:x1, :3] = cv2.blendLinear(
+                    np.ascontiguousarray(hat[:, :, :3]),
+                    np.ascontiguousarray(image[y0:y1, x0:x1, :3]),
+                    alpha, 1 - alpha)
+            else:
+                # cv2.blendLinear needs the same dtype for both images.
+                alpha = alpha[:, :, np.newaxis]
+                image[y0:y1, x0:x1, :3] = hat[:, :, :3] * alpha + \
+                    image[y0:y1, x0:x1, :3] * (1 - alpha)
 
         return image
@@ -0,0 +1,224 @@
+"""Provides metrics of running cvloops and exporters to publish them."""
+
+import bisect
+import collections
+import http.server
+import json
+import threading
+import time
+
+
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5,
+           float('inf'))
+
+
+class Metrics:
+    """Collects counters, gauges and latency histograms.
+
+    Updates are cheap (a lock, a dictionary update and a binary search for
+    histograms), so they can be recorded for every frame.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        """Initializes the `Metrics`.
+
+        Args:
+            buckets: The upper bounds of the histogram buckets in seconds,
+                     the last one should be infinity.
+        """
+        self.buckets = tuple(buckets)
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        """Increases a counter.
+
+        Args:
+            name: The counter name.
+            value: The increment. (Default: 1)
+        """
+        with self.lock:
+            self.counters[name] += value
+
+    def gauge(self, name, value):
+        """Sets a gauge.
+
+        Args:
+            name: The gauge name.
+            value: The current value.
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Records a duration in a histogram.
+
+        Args:
+            name: The histogram name, e.g. the stage.
+            seconds: The duration.
+        """
+        with self.lock:
+            try:
+                histogram = self.histograms[name]
+            except KeyError:
+                histogram = self.histograms[name] = {
+                    'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            histogram['buckets'][bisect.bisect_left(self.buckets,
+                                                    seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def snapshot(self):
+        """Returns a copy of all metrics.
+
+        Returns:
+            A dictionary with the keys time, counters, gauges and histograms.
+            The histogram buckets are not cumulative.
+        """
+        with self.lock:
+            return {
+                'time': time.time(),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: {'buckets': list(h['buckets']),
+                                      'sum': h['sum'], 'count': h['count']}
+                               for name, h in self.histograms.items()},
+            }
+
+    def prometheus(self, prefix='cvloop'):
+        """Formats the metrics in the Prometheus text exposition format.
+
+        Counters are named <prefix>_<name>_total, gauges <prefix>_<name>, and
+        all histograms are exposed as <prefix>_stage_seconds with a stage
+        label.
+
+        Args:
+            prefix: The metric name prefix. (Default: 'cvloop')
+
+        Returns:
+            The metrics as text.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append('# TYPE {}_{}_total counter'.format(prefix, name))
+            lines.append('{}_{}_total {}'.format(prefix, name, value))
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append('# TYPE {}_{} gauge'.format(prefix, name))
+            lines.append('{}_{} {}'.format(prefix, name, value))
+        if snapshot['histograms']:
+            lines.append('# TYPE {}_stage_seconds histogram'.format(prefix))
+        for name, histogram in sorted(snapshot['histograms'].items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                cumulative += count
+                lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} '
+                             '{}'.format(prefix, name,
+                                         '+Inf' if bound == float('inf')
+                                         else bound, cumulative))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(
+                prefix, name, histogram['sum']))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(
+                prefix, name, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+class PrometheusExporter:
+    """Serves the metrics for Prometheus over HTTP in a background thread."""
+
+    def __init__(self, port, host='127.0.0.1'):
+        """Initializes the `PrometheusExporter`.
+
+        The server is started when the exporter is attached to metrics.
+
+        Args:
+            port: The port to listen on, 0 picks a free port. There is no
+                  default, as the well-known exporter ports are likely
+                  taken, e.g. 9100 by the node exporter.
+            host: The address to listen on. (Default: '127.0.0.1')
+        """
+        self.address = (host, port)
+        self.server = None
+
+    def attach(self, metrics):
+        """Starts serving the metrics.
+
+        Args:
+            metrics: The metrics to serve.
+        """
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """Answers every GET request with the metrics."""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Sends the metrics."""
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                """Suppresses request logging."""
+
+        self.server = http.server.ThreadingHTTPServer(self.address, Handler)
+        self.address = self.server.server_address
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def export(self, metrics):  # pylint: disable=unused-argument
+        """Does nothing, Prometheus pulls the metrics."""
+
+    def close(self):
+        """Stops the server."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class JSONLinesExporter:
+    """Appends snapshots of the metrics to a JSON lines file."""
+
+    def __init__(self, path, interval=10):
+        """Initializes the `JSONLinesExporter`.
+
+        Args:
+            path: The file to append to.
+            interval: The minimum number of seconds between two snapshots.
+                      (Default: 10)
+        """
+        self.path = path
+        self.interval = interval
+        self.last_export = None
+        self.metrics = None
+
+    def attach(self, metrics):
+        """Starts the first interval."""
+        self.metrics = metrics
+        self.last_export = time.perf_counter()
+
+    def export(self, metrics, force=False):
+        """Writes a snapshot if the interval passed.
+
+        Args:
+            metrics: The metrics.
+            force: If True, writes regardless of the interval.
+                   (Default: False)
+        """
+        now = time.perf_counter()
+        if not force and self.last_export is not None \
+                and now - self.last_export < self.interval:
+            return
+        self.last_export = now
+        with open(self.path, 'a') as log:
+            log.write(json.dumps(metrics.snapshot()) + '\n')
+
+    def close(self):
+        """Writes a final snapshot."""
+        if self.metrics is not None:
+            self.export(self.metrics, force=True)
+            self.metrics = None
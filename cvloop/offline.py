@@ -0,0 +1,191 @@
+"""Provides frame processing without a display, e.g. for offline jobs or
+asyncio services."""
+
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def open_capture(source=None):
+    """Opens a video source.
+
+    Args:
+        source: The video source; ints for webcams/devices, a string to load
+                a video file, or any object with a read method, which is
+                returned unchanged. (Default: 0)
+
+    Returns:
+        The capture object.
+    """
+    if source is None:
+        return cv2.VideoCapture(0)
+    if isinstance(source, type(cv2.VideoCapture())) \
+            or hasattr(source, 'read'):
+        return source
+    return cv2.VideoCapture(source)
+
+
+def release(capture, source):
+    """Releases the capture if it was opened by open_capture for the source.
+
+    Args:
+        capture: The capture object.
+        source: The source the capture was opened from.
+    """
+    if capture is not source:
+        try:
+            capture.release()
+        except AttributeError:
+            pass
+
+
+def convert(frame, convert_color, dst=None):
+    """Converts the frame's colors unless convert_color is -1 or the frame is
+    no color image.
+
+    Args:
+        frame: The frame.
+        convert_color: A value for `cv2.cvtColor` or -1.
+        dst: An optional output array.
+
+    Returns:
+        The converted frame.
+    """
+    if convert_color != -1 and frame.ndim >= 3 and frame.shape[2] >= 3:
+        return cv2.cvtColor(frame, convert_color, dst=dst)
+    if dst is None:
+        return frame
+    dst[...] = frame
+    return dst
+
+
+def is_batched(function):
+    """Checks if a function accepts stacks of frames.
+
+    Functions declare this by having an attribute `batched` set to True. They
+    are then called with arrays of shape (N, height, width, channels) instead
+    of single frames and return stacks of the same length.
+
+    Args:
+        function: The function.
+
+    Returns:
+        True if the function accepts stacks of frames.
+    """
+    return getattr(function, 'batched', False)
+
+
+def iterate_frames(source=None, function=lambda x: x, *, batch_size=16,
+                   convert_color=cv2.COLOR_BGR2RGB):
+    """Reads and processes all frames of a source without displaying them.
+
+    Frames are read into a preallocated stack. Batched functions (see
+    is_batched) process up to batch_size frames with one call, all other
+    functions are called once per frame. Batched functions must not modify
+    their input in place.
+
+    The yielded original frames are views into the stack buffer, which is
+    reused for the next batch. Copy them if they are needed longer.
+
+    Args:
+        source: The video source, see open_capture. (Default: 0)
+        function: The modification function.
+                  (Default: identity function `lambda x: x`)
+        batch_size: The maximum number of frames per batch. (Default: 16)
+        convert_color: Converts the frames with the given value using
+                       `cv2.cvtColor`, unless value is -1.
+                       (Default: `cv2.COLOR_BGR2RGB`)
+
+    Yields:
+        Tuples (frame number, original frame, processed frame).
+    """
+    capture = open_capture(source)
+    batched = is_batched(function)
+    stack = None
+    frame_no = 0
+    finished = False
+    try:
+        while not finished:
+            count = 0
+            while count < batch_size:
+                ret, frame = capture.read()
+                if not ret:
+                    finished = True
+                    break
+                if stack is None:
+                    shape = convert(frame, convert_color).shape
+                    stack = np.empty((batch_size,) + shape, dtype=frame.dtype)
+                convert(frame, convert_color, dst=stack[count])
+                count += 1
+
+            if not count:
+                break
+            if batched:
+                processed = function(stack[:count])
+            else:
+                processed = [function(stack[i].copy()) for i in range(count)]
+            for i in range(count):
+                yield frame_no, stack[i], processed[i]
+                frame_no += 1
+    finally:
+        release(capture, source)
+
+
+async def aiterate_frames(source=None, function=lambda x: x, *, prefetch=2,
+                          convert_color=cv2.COLOR_BGR2RGB):
+    """Reads and processes the frames of a source without blocking the
+    event loop.
+
+    Reading and processing happen in a worker thread. At most prefetch frames
+    are read ahead, so a slow consumer slows down reading instead of filling
+    up memory.
+
+    Usage:
+        async for frame_no, original, processed in aiterate_frames(0, f):
+            ...
+
+    Args:
+        source: The video source, see open_capture. (Default: 0)
+        function: The modification function.
+                  (Default: identity function `lambda x: x`)
+        prefetch: The number of frames to read and process ahead.
+                  (Default: 2)
+        convert_color: Converts the frames with the given value using
+                       `cv2.cvtColor`, unless value is -1.
+                       (Default: `cv2.COLOR_BGR2RGB`)
+
+    Yields:
+        Tuples (frame number, original frame, processed frame).
+    """
+    loop = asyncio.get_running_loop()
+    capture = open_capture(source)
+
+    def step():
+        """Reads and processes one frame, returns None at the end."""
+        ret, frame = capture.read()
+        if not ret:
+            return None
+        frame = convert(frame, convert_color)
+        return frame, function(frame.copy())
+
+    # A single worker keeps reads in order.
+    executor = ThreadPoolExecutor(max_workers=1)
+    pending = collections.deque(loop.run_in_executor(executor, step)
+                                for _ in range(max(prefetch, 1)))
+    frame_no = 0
+    try:
+        while True:
+            item = await pending.popleft()
+            if item is None:
+                break
+            pending.append(loop.run_in_executor(executor, step))
+            yield (frame_no,) + item
+            frame_no += 1
+    finally:
+        for future in pending:
+            future.cancel()
+        await loop.run_in_executor(None, executor.shutdown)
+        release(capture, source)
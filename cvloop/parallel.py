@@ -0,0 +1,232 @@
+"""Provides a multi-process execution mode for cvloop functions.
+
+Frames are exchanged with the worker processes through a ring buffer of
+shared memory slots, only slot indices travel over the queues.
+"""
+
+import collections
+import multiprocessing
+import queue
+
+import numpy as np
+
+from .factories import create_function
+
+
+def _worker(function, kwargs, slots, in_name, out_name, shape, dtype, tasks,
+            results):
+    """Runs the function on frames found in the shared input slots.
+
+    Writes the processed frames into the output slot of the same index and
+    reports the index, shape, and dtype of the result.
+
+    Args:
+        function: The function to apply, each worker has its own copy, or its
+                  name, see create_function.
+        kwargs: The keyword arguments to create the function with.
+        slots: The number of slots in the ring buffer.
+        in_name: The name of the input shared memory block.
+        out_name: The name of the output shared memory block.
+        shape: The frame shape.
+        dtype: The frame dtype.
+        tasks: The queue to receive slot indices from. None stops the worker.
+        results: The queue to report processed slots to.
+    """
+    # Python 3.8+, imported here so cvloop can be imported on older versions.
+    from multiprocessing import shared_memory  # noqa: E501 pylint: disable=import-outside-toplevel
+
+    if isinstance(function, str):
+        function = create_function(function, kwargs)
+    in_memory = shared_memory.SharedMemory(name=in_name)
+    out_memory = shared_memory.SharedMemory(name=out_name)
+    frames = np.ndarray((slots,) + shape, dtype=dtype, buffer=in_memory.buf)
+    slot_size = out_memory.size // slots
+    try:
+        for slot in iter(tasks.get, None):
+            try:
+                processed = np.asarray(function(frames[slot]))
+                if processed.nbytes > slot_size:
+                    raise ValueError('The processed frame ({} bytes) does '
+                                     'not fit into a slot ({} bytes).'
+                                     .format(processed.nbytes, slot_size))
+                out = np.ndarray(processed.shape, dtype=processed.dtype,
+                                 buffer=out_memory.buf,
+                                 offset=slot * slot_size)
+                out[...] = processed
+                results.put((slot, processed.shape, processed.dtype.str,
+                             None))
+            except Exception as error:  # pylint: disable=broad-except
+                results.put((slot, None, None, repr(error)))
+    finally:
+        del frames
+        in_memory.close()
+        out_memory.close()
+
+
+class ProcessPool:
+    """Runs a function in worker processes, passing frames via shared memory.
+
+    The `ProcessPool` is a callable and can be used as a cvloop function. The
+    frames are processed in a pipeline: each call submits a frame and returns
+    the oldest finished frame, which is `workers - 1` frames behind the
+    submitted one. While the pipeline fills, calls return None, and at the
+    end of the stream, drain returns the frames still in the pipeline.
+
+    With the `fork` start method (the default on Linux), the workers inherit
+    the function. With `spawn` or `forkserver` it has to be pickled, which
+    lambdas and the classes in `cvloop.functions` (they hold OpenCV objects
+    and locks) are not: pass the name of the function's class and its
+    keyword arguments instead, as for `python -m cvloop process`, and each
+    worker creates its own instance. Each worker has its own copy, so
+    stateful functions like background subtractors only see every
+    `workers`-th frame.
+
+    The shared memory is allocated on the first call, using the shape and
+    dtype of the first frame. All frames must have that shape and dtype.
+    """
+
+    def __init__(self, function, workers=None, output_scale=1, kwargs=None):
+        """Initializes the `ProcessPool`.
+
+        Args:
+            function: The function to run in the workers, or the name of a
+                      class in cvloop.functions or an import path like
+                      `package.module:Class` to create it from.
+            workers: The number of worker processes.
+                     (Default: multiprocessing.cpu_count())
+            output_scale: The size of an output slot relative to an input
+                          frame. Increase it if the function returns larger
+                          images than it receives. (Default: 1)
+            kwargs: The keyword arguments to create the function with, if
+                    its name is given. (Default: None)
+        """
+        self.function = function
+        self.kwargs = kwargs
+        self.workers = workers or multiprocessing.cpu_count()
+        self.slots = 2 * self.workers
+        self.output_scale = output_scale
+
+        self.processes = []
+        self.tasks = None
+        self.results = None
+        self.in_memory = None
+        self.out_memory = None
+        self.frames = None
+
+        self.free = collections.deque()
+        self.pending = collections.deque()
+        self.finished = {}
+
+    def start(self, frame):
+        """Allocates the shared memory and starts the worker processes.
+
+        Args:
+            frame: A frame with the shape and dtype of all following frames.
+        """
+        from multiprocessing import shared_memory  # noqa: E501 pylint: disable=import-outside-toplevel
+
+        shape = frame.shape
+        dtype = frame.dtype
+        self.in_memory = shared_memory.SharedMemory(
+            create=True, size=self.slots * frame.nbytes)
+        self.out_memory = shared_memory.SharedMemory(
+            create=True,
+            size=self.slots * int(frame.nbytes * self.output_scale))
+        self.frames = np.ndarray((self.slots,) + shape, dtype=dtype,
+                                 buffer=self.in_memory.buf)
+
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        for _ in range(self.workers):
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(self.function, self.kwargs, self.slots,
+                      self.in_memory.name, self.out_memory.name, shape,
+                      dtype, self.tasks, self.results),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+        self.free.extend(range(self.slots))
+
+    def submit(self, frame):
+        """Copies the frame into a free slot and queues it for processing.
+
+        Args:
+            frame: The frame.
+        """
+        if self.frames is None:
+            self.start(frame)
+        slot = self.free.popleft()
+        self.frames[slot] = frame
+        self.pending.append(slot)
+        self.tasks.put(slot)
+
+    def result(self):
+        """Waits for the oldest submitted frame to be processed.
+
+        Returns:
+            A copy of the processed frame.
+
+        Raises:
+            RuntimeError: If the function raised an error in a worker or a
+                          worker died.
+        """
+        slot = self.pending.popleft()
+        while slot not in self.finished:
+            try:
+                done, shape, dtype, error = self.results.get(timeout=1)
+            except queue.Empty:
+                for process in self.processes:
+                    if not process.is_alive():
+                        raise RuntimeError('Worker died with exit code {}.'
+                                           .format(process.exitcode))
+                continue
+            self.finished[done] = (shape, dtype, error)
+        shape, dtype, error = self.finished.pop(slot)
+        self.free.append(slot)
+        if error is not None:
+            raise RuntimeError('Worker failed: {}'.format(error))
+        slot_size = self.out_memory.size // self.slots
+        return np.ndarray(shape, dtype=np.dtype(dtype),
+                          buffer=self.out_memory.buf,
+                          offset=slot * slot_size).copy()
+
+    def __call__(self, image):
+        """Submits the image and returns the oldest processed frame.
+
+        Args:
+            image: The image.
+
+        Returns:
+            The processed frame submitted `workers - 1` calls before, or None
+            while the pipeline fills.
+        """
+        self.submit(image)
+        if len(self.pending) >= self.workers:
+            return self.result()
+        return None
+
+    def drain(self):
+        """Waits for all submitted frames to be processed.
+
+        Returns:
+            A list of the processed frames in submission order.
+        """
+        return [self.result() for _ in range(len(self.pending))]
+
+    def close(self):
+        """Stops the workers and releases the shared memory."""
+        if self.frames is None:
+            return
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.frames = None
+        for memory in (self.in_memory, self.out_memory):
+            memory.close()
+            memory.unlink()
+        self.free.clear()
+        self.pending.clear()
+        self.finished.clear()
@@ -0,0 +1,115 @@
+"""Provides region of interest processing for cvloop functions."""
+
+import numpy as np
+
+from .functions import BackgroundSubtractorMOG2
+
+
+class RegionOfInterest:
+    """Applies a function only to regions of interest of the image.
+
+    Each region is cropped as a view of the image and passed to the function.
+    Results which are not computed in place are written back into the region,
+    everything outside the regions stays untouched.
+
+    Optionally, processing is gated by motion: a background subtractor
+    determines the foreground of the image, and regions without enough
+    foreground pixels reuse their last processed result instead of calling
+    the function.
+    """
+
+    # Runtime state, not parameters (see cvloop.cache.function_key).
+    cache_ignore = ('results', 'skipped')
+
+    def __init__(self, function, regions, motion_gate=False,
+                 motion_threshold=0.001, subtractor=None):
+        """Initializes the `RegionOfInterest`.
+
+        Args:
+            function: The function to apply to the regions.
+            regions: Either a list of rectangles (x, y, width, height) or a
+                     boolean mask with the image's height and width. For a
+                     mask, the function is applied to the mask's bounding box
+                     and only pixels inside the mask are changed, unless the
+                     function works in place.
+            motion_gate: If True, regions are only processed if the fraction
+                         of foreground pixels inside exceeds motion_threshold.
+                         (Default: False)
+            motion_threshold: The fraction of foreground pixels needed to
+                              process a region. (Default: 0.001)
+            subtractor: The background subtractor for the motion gate.
+                        Defaults to a `BackgroundSubtractorMOG2` modeling the
+                        background in gray scale at a quarter of the size,
+                        which is cheap enough not to eat up the savings.
+        """
+        self.function = function
+        if isinstance(regions, np.ndarray):
+            rows = np.flatnonzero(regions.any(axis=1))
+            cols = np.flatnonzero(regions.any(axis=0))
+            if not len(rows):
+                raise ValueError('The region mask is empty.')
+            x, y = cols[0], rows[0]
+            width, height = cols[-1] - x + 1, rows[-1] - y + 1
+            self.regions = [(x, y, width, height)]
+            self.masks = [regions[y:y + height, x:x + width].astype(bool)]
+        else:
+            self.regions = [tuple(region) for region in regions]
+            self.masks = [None] * len(self.regions)
+
+        self.motion_gate = motion_gate
+        self.motion_threshold = motion_threshold
+        if motion_gate and subtractor is None:
+            subtractor = BackgroundSubtractorMOG2(scale=.25, grayscale=True)
+        self.subtractor = subtractor
+
+        self.results = [None] * len(self.regions)
+        self.skipped = 0
+
+    def __call__(self, image):
+        """Applies the function to all regions of the image.
+
+        Args:
+            image: The image.
+
+        Returns:
+            The image with processed regions.
+        """
+        foreground = self.subtractor(image) if self.motion_gate else None
+
+        for i, (x, y, width, height) in enumerate(self.regions):
+            view = image[y:y + height, x:x + width]
+            mask = self.masks[i]
+
+            if foreground is not None and self.results[i] is not None:
+                moving = foreground[y:y + height, x:x + width] > 0
+                if mask is not None:
+                    moving &= mask
+                if np.count_nonzero(moving) <= self.motion_threshold * \
+                        moving.size:
+                    self.skipped += 1
+                    self.paste(view, self.results[i], mask)
+                    continue
+
+            result = np.asarray(self.function(view))
+            if result.ndim == view.ndim - 1:
+                result = result[..., np.newaxis]
+            if mask is not None or not np.may_share_memory(result, view):
+                self.paste(view, result, mask)
+            if self.motion_gate:
+                self.results[i] = view.copy()
+        return image
+
+    @staticmethod
+    def paste(view, result, mask=None):
+        """Writes the result into the view, restricted to the mask.
+
+        Args:
+            view: The region of the image.
+            result: The processed region.
+            mask: A boolean mask of the view's height and width or None.
+        """
+        if mask is None:
+            view[...] = result
+        else:
+            np.copyto(view, result,
+                      where=mask if view.ndim == 2 else mask[..., np.newaxis])
@@ -0,0 +1,246 @@
+"""Provides capture sources which do not need a camera or video file.
+
+The sources implement the parts of the `cv2.VideoCapture` interface cvloop
+uses (`read`, `grab`, `retrieve`, `get`, `release`) and are meant for
+reproducible tests and benchmarks.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+class _Source:
+    """Common base of the sources: paces reads and answers `get` queries."""
+
+    def __init__(self, width, height, fps, frame_count):
+        """Initializes the source.
+
+        Args:
+            width: The frame width.
+            height: The frame height.
+            fps: The frame rate to deliver frames at. If None, frames are
+                 delivered as fast as possible.
+            frame_count: The number of frames, None for endless sources.
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_count = frame_count
+        self.position = 0
+        self.grabbed = None
+        self.released = False
+        self.next_time = None
+
+    def wait(self):
+        """Waits until the next frame is due if a frame rate is set."""
+        if not self.fps:
+            return
+        now = time.perf_counter()
+        if self.next_time is None:
+            self.next_time = now
+        elif now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time = max(self.next_time, now) + 1 / self.fps
+
+    def frame(self, index, out=None):
+        """Returns the frame at index, written into out if it fits."""
+        raise NotImplementedError
+
+    @staticmethod
+    def fits(out, shape, dtype):
+        """Checks if out can hold a frame of shape and dtype."""
+        return out is not None and out.shape == shape and out.dtype == dtype
+
+    def grab(self):
+        """Advances to the next frame.
+
+        Returns:
+            False if the source is released or exhausted, True otherwise.
+        """
+        if self.released or (self.frame_count is not None and
+                             self.position >= self.frame_count):
+            self.grabbed = None
+            return False
+        self.wait()
+        self.grabbed = self.position
+        self.position += 1
+        return True
+
+    def retrieve(self, image=None):
+        """Returns the last grabbed frame.
+
+        Args:
+            image: An array to write the frame into, like in
+                   `cv2.VideoCapture.retrieve`. It is only used if shape and
+                   dtype fit. (Default: None)
+
+        Returns:
+            A tuple of a success flag and the frame.
+        """
+        if self.grabbed is None:
+            return False, None
+        return True, self.frame(self.grabbed, image)
+
+    def read(self, image=None):
+        """Grabs and retrieves the next frame.
+
+        Args:
+            image: An array to write the frame into, see retrieve.
+                   (Default: None)
+
+        Returns:
+            A tuple of a success flag and the frame.
+        """
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop):
+        """Answers some `cv2.CAP_PROP_*` queries.
+
+        Args:
+            prop: The property.
+
+        Returns:
+            The value, 0 for unknown properties.
+        """
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps or 0,
+            cv2.CAP_PROP_FRAME_COUNT: self.frame_count or 0,
+            cv2.CAP_PROP_POS_FRAMES: self.position,
+        }.get(prop, 0)
+
+    def release(self):
+        """Releases the source, subsequent reads fail."""
+        self.released = True
+
+    def isOpened(self):  # pylint: disable=invalid-name
+        """Returns True unless the source is released."""
+        return not self.released
+
+
+class SyntheticSource(_Source):
+    """Generates frames with shapes moving over a gradient.
+
+    The frames are deterministic for a given seed and frame number and are
+    generated in BGR order, like frames of a `cv2.VideoCapture`.
+    """
+
+    def __init__(self, width=640, height=480, *, dtype=np.uint8, fps=None,
+                 frame_count=None, shapes=5, seed=0):
+        """Initializes the `SyntheticSource`.
+
+        Args:
+            width: The frame width. (Default: 640)
+            height: The frame height. (Default: 480)
+            dtype: The frame dtype. Integer frames use their full value range,
+                   floating point frames values between 0 and 1.
+                   (Default: np.uint8)
+            fps: The frame rate to deliver frames at. If None, frames are
+                 delivered as fast as possible. (Default: None)
+            frame_count: The number of frames, None for an endless source.
+                         (Default: None)
+            shapes: The number of moving shapes. (Default: 5)
+            seed: The random seed for the shapes. (Default: 0)
+        """
+        super().__init__(width, height, fps, frame_count)
+        self.dtype = np.dtype(dtype)
+        rng = np.random.RandomState(seed)
+        self.shapes = [{
+            'circle': rng.rand() < .5,
+            'start': rng.rand(2) * (width, height),
+            'velocity': (rng.rand(2) - .5) * min(width, height) / 10,
+            'size': int(rng.randint(5, max(6, min(width, height) // 8))),
+            'color': tuple(int(c) for c in rng.randint(0, 256, 3)),
+        } for _ in range(shapes)]
+        gradient = np.linspace(0, 255, width, dtype=np.uint8)
+        self.background = np.empty((height, width, 3), dtype=np.uint8)
+        self.background[...] = gradient[np.newaxis, :, np.newaxis]
+
+    @property
+    def cache_key(self):
+        """Identifies the generated frames for cvloop.ResultCache."""
+        return 'synthetic:{}x{}:{}:{}'.format(self.width, self.height,
+                                              self.dtype, self.shapes)
+
+    def frame(self, index, out=None):
+        """Renders the frame at index, into out if it fits."""
+        if self.dtype == np.uint8 and self.fits(out, self.background.shape,
+                                                self.dtype):
+            frame = out
+            frame[...] = self.background
+        else:
+            frame = self.background.copy()
+        bounds = np.array((self.width, self.height))
+        for shape in self.shapes:
+            # Bounce off the borders by mirroring the position.
+            x, y = np.abs((shape['start'] + shape['velocity'] * index
+                           + bounds) % (2 * bounds) - bounds).astype(int)
+            if shape['circle']:
+                cv2.circle(frame, (int(x), int(y)), shape['size'],
+                           shape['color'], -1)
+            else:
+                cv2.rectangle(frame, (int(x), int(y)),
+                              (int(x) + shape['size'], int(y) + shape['size']),
+                              shape['color'], -1)
+        if self.dtype == np.uint8:
+            return frame
+        if np.issubdtype(self.dtype, np.integer):
+            high = np.iinfo(self.dtype).max
+        else:
+            high = 1
+        return (frame * (high / 255)).astype(self.dtype)
+
+
+class ReplaySource(_Source):
+    """Replays pre-decoded frames from memory or a memory mapped file."""
+
+    def __init__(self, frames, *, fps=None, loop=False):
+        """Initializes the `ReplaySource`.
+
+        Args:
+            frames: An array of frames (frames, height, width[, channels]) or
+                    the path of a .npy file, which is memory mapped.
+            fps: The frame rate to deliver frames at. If None, frames are
+                 delivered as fast as possible. (Default: None)
+            loop: If True, starts again after the last frame. (Default: False)
+        """
+        if isinstance(frames, str):
+            frames = np.load(frames, mmap_mode='r')
+        self.frames = frames
+        self.loop = loop
+        super().__init__(frames.shape[2], frames.shape[1], fps,
+                         None if loop else len(frames))
+
+    def frame(self, index, out=None):
+        """Returns a copy of the frame at index, written into out if it
+        fits."""
+        frame = self.frames[index % len(self.frames)]
+        if self.fits(out, frame.shape, frame.dtype):
+            out[...] = frame
+            return out
+        return np.array(frame)
+
+    @classmethod
+    def record(cls, capture, count, **kwargs):
+        """Reads count frames from a capture into memory for replaying.
+
+        Args:
+            capture: The capture to read from.
+            count: The maximum number of frames to read.
+            kwargs: Passed on to `ReplaySource`.
+
+        Returns:
+            The `ReplaySource`.
+        """
+        frames = []
+        for _ in range(count):
+            ret, frame = capture.read()
+            if not ret:
+                break
+            frames.append(frame)
+        return cls(np.stack(frames), **kwargs)
@@ -0,0 +1,191 @@
+"""Benchmarks for cvloop and cvloop.functions.
+
+Usage:
+    python3 tools/benchmark.py <benchmark> [options]
+
+Run with --help to list the available benchmarks.
+"""
+
+import argparse
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, '.')
+import cvloop  # noqa: E402
+
+
+def synthetic_frames(count, height, width):
+    """Renders frames of a SyntheticSource.
+
+    Args:
+        count: the number of frames
+        height: the frame height
+        width: the frame width
+    Returns:
+        A list of uint8 frames.
+    """
+    source = cvloop.SyntheticSource(width, height, frame_count=count)
+    return [source.read()[1] for _ in range(count)]
+
+
+def run_streams(functions, frames):
+    """Runs each function over all frames in its own thread.
+
+    Args:
+        functions: one function per stream
+        frames: the frames each stream processes
+    Returns:
+        The processed frames per second over all streams.
+    """
+    def stream(function):
+        for frame in frames:
+            function(frame.copy())
+
+    threads = [threading.Thread(target=stream, args=(function,))
+               for function in functions]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(functions) * len(frames) / (time.perf_counter() - start)
+
+
+def benchmark_threads(args):
+    """Compares the throughput of one stream to N concurrent streams.
+
+    Each stream uses its own clone of the function. Prints the frames per
+    second and the speedup for each function.
+    """
+    frames = synthetic_frames(args.frames, args.height, args.width)
+    candidates = {
+        'Inverter': cvloop.Inverter(),
+        'BackgroundSubtractorMOG2': cvloop.BackgroundSubtractorMOG2(),
+        'ForegroundExtractor': cvloop.ForegroundExtractor(),
+    }
+    for name, function in candidates.items():
+        single = run_streams([function.clone()], frames)
+        multi = run_streams([function.clone() for _ in range(args.streams)],
+                            frames)
+        print('{:<26} 1 stream: {:8.1f} fps  {} streams: {:8.1f} fps  '
+              'speedup: {:.2f}'.format(name, single, args.streams, multi,
+                                       multi / single))
+
+
+def benchmark_umat(args):
+    """Compares a chain of OpenCV-based functions on numpy arrays and UMats.
+
+    The chain converts colors, extracts the foreground with a downscaled
+    `BackgroundSubtractorMOG2`, and inverts the result. UMat frames are
+    converted back to numpy arrays at the end, as cvloop does for display.
+    """
+    import cv2  # pylint: disable=import-outside-toplevel
+
+    frames = synthetic_frames(args.frames, args.height, args.width)
+    print('OpenCL available: {}'.format(cv2.ocl.haveOpenCL()))
+    for name, wrap, unwrap in (
+            ('numpy', lambda f: f, lambda f: f),
+            ('UMat', cv2.UMat, lambda f: f.get())):
+        extractor = cvloop.ForegroundExtractor(
+            cvloop.BackgroundSubtractorMOG2(scale=.5))
+        inverter = cvloop.Inverter()
+        start = time.perf_counter()
+        for frame in frames:
+            image = cv2.cvtColor(wrap(frame), cv2.COLOR_BGR2RGB)
+            unwrap(inverter(extractor(image)))
+        print('{:<6} {:8.1f} fps'.format(
+            name, len(frames) / (time.perf_counter() - start)))
+
+
+def benchmark_buffers(args):
+    """Compares reading and color converting frames with and without a
+    `cvloop.FramePool`.
+
+    Frames are replayed from memory, so the numbers show the cost of the
+    allocations: minor page faults and garbage collections per frame. Use
+    e.g. --height 2160 --width 3840 for 4K.
+    """
+    import cv2  # pylint: disable=import-outside-toplevel
+
+    frames = cvloop.ReplaySource.record(
+        cvloop.SyntheticSource(args.width, args.height), 8).frames
+    for name, size in (('allocating', 0), ('pooled', 4)):
+        source = cvloop.ReplaySource(frames, loop=True)
+        read_buffers = cvloop.FramePool(size)
+        convert_buffers = cvloop.FramePool(size)
+        gc.collect()
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        collections = sum(stats['collections'] for stats in gc.get_stats())
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            _, frame = source.read(image=read_buffers.get())
+            read_buffers.put(frame)
+            converted = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB,
+                                     dst=convert_buffers.get())
+            convert_buffers.put(converted)
+        seconds = time.perf_counter() - start
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+        collections = sum(stats['collections']
+                          for stats in gc.get_stats()) - collections
+        print('{:<10} {:8.1f} fps  {:8.1f} page faults/frame  {:4d} GCs  '
+              '{:3d} buffers allocated'.format(
+                  name, args.frames / seconds, faults / args.frames,
+                  collections, read_buffers.allocations +
+                  convert_buffers.allocations))
+
+
+def benchmark_tiles(args):
+    """Compares untiled and tiled face detection of `DrawHat` on large
+    synthetic frames.
+
+    Prints the frames per second of both and the faces found per frame, which
+    should be equal. Requires a Haar cascade file (--cascade).
+    """
+    if not os.path.isfile(args.cascade):
+        print('No cascade found at {}, use --cascade.'.format(args.cascade))
+        return
+    frames = synthetic_frames(args.frames, args.height, args.width)
+    hat_path = os.path.join(os.path.dirname(__file__), os.pardir, 'examples',
+                            'hat.png')
+    for name, tiles in (('untiled', None), ('tiled', args.tiles)):
+        draw_hat = cvloop.DrawHat(hat_path, args.cascade, tiles=tiles)
+        faces = 0
+        start = time.perf_counter()
+        for frame in frames:
+            faces += len(draw_hat.find_faces(frame))
+        print('{:<8} {:8.1f} fps  {:.1f} faces/frame'.format(
+            name, len(frames) / (time.perf_counter() - start),
+            faces / len(frames)))
+        draw_hat.close()
+
+
+BENCHMARKS = {
+    'buffers': benchmark_buffers,
+    'threads': benchmark_threads,
+    'tiles': benchmark_tiles,
+    'umat': benchmark_umat,
+}
+
+
+def main():
+    """Parses the arguments and runs the selected benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--streams', type=int, default=4)
+    parser.add_argument('--tiles', type=int, default=2)
+    parser.add_argument('--cascade', default=os.path.join(
+        cvloop.OPENCV_CASCADE_PATH, 'haarcascades',
+        'haarcascade_frontalface_default.xml'))
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ notebook."""
 
 import inspect
 import json
+import re
 import sys
 
 sys.path.insert(0, '../cvloop')
@@ -25,13 +26,14 @@ def is_mod_function(mod, fun):
 
 
 def is_mod_class(mod, cls):
-    """Checks if a class in a module was declared in that module.
+    """Checks if a public class in a module was declared in that module.
 
     Args:
         mod: the module
         cls: the class
     """
-    return inspect.isclass(cls) and inspect.getmodule(cls) == mod
+    return inspect.isclass(cls) and inspect.getmodule(cls) == mod \
+        and not cls.__name__.startswith('_')
 
 
 def list_functions(mod_name):
@@ -62,25 +64,28 @@ def list_classes(mod_name):
             if is_mod_class(mod, cls)]
 
 
-def get_linenumbers(functions, module, searchstr='def {}(image):\n'):
+def get_linenumbers(functions, module, searchstr=r'def {}\(image\):$'):
     """Returns a dictionary which maps function names to line numbers.
 
     Args:
         functions: a list of function names
         module:    the module to look the functions up
-        searchstr: the string to search for
+        searchstr: the regular expression to search for, {} is replaced by
+                   the function name
     Returns:
         A dictionary with functions as keys and their line numbers as values.
     """
     lines = inspect.getsourcelines(module)[0]
     line_numbers = {}
     for function in functions:
-        try:
-            line_numbers[function] = lines.index(
-                    searchstr.format(function)) + 1
-        except ValueError:
-            print(r'Can not find `{}`'.format(searchstr.format(function)))
-            line_numbers[function] = 0
+        pattern = re.compile(searchstr.format(re.escape(function)))
+        line_numbers[function] = 0
+        for number, line in enumerate(lines):
+            if pattern.match(line):
+                line_numbers[function] = number + 1
+                break
+        else:
+            print(r'Can not find `{}`'.format(pattern.pattern))
     return line_numbers
 
 
@@ -195,7 +200,7 @@ def main():
     functions = list_functions('cvloop.functions')
 
     line_numbers_cls = get_linenumbers(classes, cvloop.functions,
-                                       'class {}:\n')
+                                       r'class {}[(:]')
     line_numbers = get_linenumbers(functions, cvloop.functions)
 
     for cls in classes: